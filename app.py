@@ -2,19 +2,29 @@ from flask import Flask, request, abort
 from linebot.v3 import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
-    Configuration, ApiClient, MessagingApi,
-    ReplyMessageRequest, PushMessageRequest, 
-    TextMessage, FlexMessage, FlexContainer
+    Configuration,
+    ReplyMessageRequest,
+    TextMessage
 )
 from linebot.v3.webhooks import MessageEvent, TextMessageContent, PostbackEvent
 import os
-import re
-import uuid  # ✅ 新增 UUID 產生功能
 import supabase
-import json
 from dotenv import load_dotenv
-from datetime import datetime
 from flask_cors import CORS
+# ✅ 指令解析與回覆內容（與 asgi.py 共用）
+from bot_commands import (
+    NO_PROJECT_TEXT, PIAO_ERROR_TEXT, WEEKLY_REPORT_ERROR, SEARCH_ERROR, SEARCH_FORMAT_TEXT,
+    SHARE_ERROR, SHARE_SAVE_ERROR, SHARE_FORMAT_TEXT, SHARE_HELP_TEXT, STAGE_COUNT_FORMAT_TEXT,
+    PROJECT_CREATE_FAILED_TEXT, PROJECT_CREATE_ERROR, JOIN_FORMAT_TEXT, JOIN_NO_PROJECT_TEXT,
+    JOIN_DUPLICATE_TEXT, JOIN_ERROR,
+    START_ALT_TEXT, PIAO_ALT_TEXT, WEEKLY_REPORT_ALT_TEXT, PROJECT_SUMMARY_ALT_TEXT,
+    command_for, load_flex, report_message, text_messages,
+    latest_project_query, project_resources_query, existing_member_query, first_id,
+    parse_search, parse_share, shared_text, start_project, parse_stage_count,
+    project_created_messages, parse_join, new_member, joined_text
+)
+from line_sender import LineSender
+from resource_search import ResourceIndexCache, format_search_results
 
 # 讀取 .env 環境變數
 load_dotenv()
@@ -24,9 +34,16 @@ app = Flask(__name__)
 CORS(app)  # ✅ 啟用 CORS 支援
 
 # 設定 LINE API
-configuration = Configuration(access_token=os.getenv('CHANNEL_ACCESS_TOKEN'))
+# LINE_API_HOST 可指向本機的假 LINE 伺服器（見 fake_line_server.py）做測試
+configuration = Configuration(
+    host=os.getenv('LINE_API_HOST', 'https://api.line.me'),
+    access_token=os.getenv('CHANNEL_ACCESS_TOKEN')
+)
 line_handler = WebhookHandler(os.getenv('CHANNEL_SECRET'))
 
+# ✅ 所有對外的 reply / push 都經過 LineSender（限流、429/5xx 重試、合併推送）
+line_sender = LineSender(configuration)
+
 # 連接 Supabase
 supabase_url = os.getenv('SUPABASE_URL')
 supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
@@ -35,6 +52,9 @@ supabase_client = supabase.create_client(supabase_url, supabase_key)
 # **使用字典來存放用戶的對話狀態**
 user_state = {}
 
+# **#搜尋 用的分享資源索引（依專案 LRU 快取）**
+resource_indexes = ResourceIndexCache()
+
 @app.route("/callback", methods=['POST'])
 def callback():
     """處理來自 LINE 的 Webhook"""
@@ -56,351 +76,174 @@ def callback():
 
     return 'OK'
 
-def handle_share_message(user_message, line_id, project_id):
-    match = re.match(r"#分享\s+(\S+)\s+(\S+)\s+(https?://\S+)(?:\s+(.*))?", user_message)
-    if not match:
-        return "❗️格式錯誤，請使用：#分享 資源名稱 標籤 連結 描述（描述可省略）"
+def latest_project_id(group_id):
+    """查詢群組最新的專案 ID，沒有則回傳 None"""
+    return first_id(latest_project_query(supabase_client, group_id).execute())
 
-    title, tag, link, description = match.groups()
-    description = description or ""
+def handle_share_message(user_message, line_id, project_id):
+    resource = parse_share(user_message, line_id, project_id)
+    if resource is None:
+        return SHARE_FORMAT_TEXT
 
     try:
-        supabase_client.table("shared_resources").insert({
-            "id": str(uuid.uuid4()),
-            "user_id": line_id,
-            "project_id": project_id,
-            "title": title,
-            "tag": tag,
-            "link": link,
-            "description": description,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
-        return f"✅ 資源「{title}」已成功分享！"
+        supabase_client.table("shared_resources").insert(resource).execute()
+        resource_indexes.add_resource(project_id, resource)  # ✅ 增量更新搜尋索引
+        return shared_text(resource)
     except Exception as e:
-        return f"❌ 儲存失敗：{str(e)}"
-
-def push_debug_message(api, user_id_or_group_id, text):
+        return SHARE_SAVE_ERROR.format(e)
+
+def handle_search_message(user_message, group_id):
+    """#搜尋 關鍵字：從記憶體索引查詢群組專案分享過的資源"""
+    keyword = parse_search(user_message)
+    if not keyword:
+        return SEARCH_FORMAT_TEXT
+
+    project_id = resource_indexes.project_id_for(group_id)
+    if project_id is None:
+        project_id = latest_project_id(group_id)
+        if not project_id:
+            return NO_PROJECT_TEXT
+        resource_indexes.set_project_id(group_id, project_id)
+
+    # 索引不在快取中才查詢資料庫建立
+    index = resource_indexes.get(project_id)
+    if index is None:
+        rows = project_resources_query(supabase_client, project_id).execute().data
+        index = resource_indexes.build(project_id, rows)
+
+    return format_search_results(keyword, index.search(keyword))
+
+def handle_join_message(user_message, user_id, group_id):
+    """學號／姓名／加入專案：讓使用者加入當前群組的最新專案"""
+    parsed = parse_join(user_message)
+    if parsed is None:
+        return JOIN_FORMAT_TEXT
+
+    project_id = latest_project_id(group_id)
+    if not project_id:
+        return JOIN_NO_PROJECT_TEXT
+
+    # **檢查這個使用者是否已經加入專案**
+    if existing_member_query(supabase_client, user_id, project_id).execute().data:
+        return JOIN_DUPLICATE_TEXT
+
+    member = new_member(project_id, user_id, *parsed)
+    supabase_client.table("project_members").insert(member).execute()
+    return joined_text(member)
+
+def push_debug_message(user_id_or_group_id, text):
     try:
-        api.push_message(
-            PushMessageRequest(
-                to=user_id_or_group_id,
-                messages=[TextMessage(text=f"🐞 Debug：{text}")]
-            )
-        )
+        # 同時間送往同一對象的 debug 訊息會合併成一次 push
+        line_sender.send(user_id_or_group_id, TextMessage(text=f"🐞 Debug：{text}"))
     except Exception as e:
         print(f"⚠️ Debug 傳送失敗：{e}")
 
+def run_command(command, user_message, user_id, group_id):
+    """執行指令（見 bot_commands.command_for），回傳要回覆的訊息"""
+    if command == "start":
+        return [load_flex("card.json", START_ALT_TEXT)]
+
+    if command == "piao":
+        try:
+            return [load_flex("piao.json", PIAO_ALT_TEXT)]
+        except Exception as e:
+            print(f"❌ 載入 piao.json 發生錯誤：{e}")
+            return text_messages(PIAO_ERROR_TEXT)
+
+    if command == "weekly_report":
+        try:
+            from weekly_report import generate_weekly_report
+            return [report_message(generate_weekly_report(group_id), WEEKLY_REPORT_ALT_TEXT)]
+        except Exception as e:
+            return text_messages(WEEKLY_REPORT_ERROR.format(e))
+
+    if command == "project_summary":
+        from project_summary_report import generate_project_summary
+
+        project_id = latest_project_id(group_id)
+        if not project_id:
+            return text_messages(NO_PROJECT_TEXT)
+        return [report_message(generate_project_summary(project_id), PROJECT_SUMMARY_ALT_TEXT)]
+
+    if command == "search":
+        try:
+            return text_messages(handle_search_message(user_message, group_id))
+        except Exception as e:
+            return text_messages(SEARCH_ERROR.format(e))
+
+    if command == "share":
+        try:
+            project_id = latest_project_id(group_id)
+            if not project_id:
+                return text_messages(NO_PROJECT_TEXT)
+            return text_messages(handle_share_message(user_message, user_id, project_id))
+        except Exception as e:
+            return text_messages(SHARE_ERROR.format(e))
+
+    if command == "stage_count":
+        project = parse_stage_count(user_message, user_id, group_id, user_state)
+        if project is None:
+            return text_messages(STAGE_COUNT_FORMAT_TEXT)
+        try:
+            if not supabase_client.table("projects").insert(project).execute().data:
+                return text_messages(PROJECT_CREATE_FAILED_TEXT)
+        except Exception as e:
+            return text_messages(PROJECT_CREATE_ERROR.format(e))
+        print(f"✅ 專案已建立，UUID: {project['id']}")  # Debug log
+        resource_indexes.set_project_id(group_id, project["id"])  # ✅ 搜尋改指向新專案
+        return project_created_messages(project)
+
+    if command == "join":
+        try:
+            return text_messages(handle_join_message(user_message, user_id, group_id))
+        except Exception as e:
+            return text_messages(JOIN_ERROR.format(e))
+
+    if command == "create_project":
+        return text_messages(start_project(user_message, user_id, user_state))
+
 @line_handler.add(MessageEvent, message=TextMessageContent)
 def handle_message(event):
     """處理 LINE 訊息"""
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        user_message = event.message.text.strip()
-        
-        # **判斷訊息來自個人還是群組**
-        user_id = event.source.user_id if hasattr(event.source, "user_id") else None
-        group_id = event.source.group_id if hasattr(event.source, "group_id") else None
-
-        # **處理「開始使用」訊息**
-        print(f"📩 收到的訊息內容: {user_message}")  # 確認收到的訊息
-        if user_message == "開始使用":
-            # 讀取 JSON 檔案
-            with open("card.json", "r", encoding="utf-8") as f:
-                flex_json = json.load(f)
-
-            # 轉換為 FlexContainer
-            flex_content = FlexContainer.from_json(json.dumps(flex_json))
-
-            # 建立 FlexMessage
-            flex_message = FlexMessage(alt_text="計畫飄飄👻 開始使用說明", contents=flex_content)
-
-            # 發送訊息
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[flex_message]
-                )
-            )
-            return
-
-        # **處理「呼叫飄飄」訊息**
-        if user_message == "呼叫飄飄":
-            try:
-                with open("piao.json", "r", encoding="utf-8") as f:
-                    flex_json = json.load(f)
-
-                flex_content = FlexContainer.from_json(json.dumps(flex_json))
-                flex_message = FlexMessage(alt_text="呼叫飄飄👻", contents=flex_content)
-
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[flex_message]
-                    )
-                )
-            except Exception as e:
-                print(f"❌ 載入 piao.json 發生錯誤：{e}")
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[TextMessage(text="❌ 無法載入飄飄畫面，請稍後再試！")]
-                    )
-                )
-            return
-
-
-        if user_message == "本週結算":
-            try:
-                from weekly_report import generate_weekly_report
-                
-                # ⚙️ 呼叫週報產生函式（會回傳 JSON dict 或錯誤訊息）
-                result = generate_weekly_report(group_id)
-        
-                # ✅ 若為錯誤訊息（字串）
-                if isinstance(result, str):
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[TextMessage(text=result)]
-                        )
-                    )
-                else:
-                    # ✅ 否則為 JSON dict，需轉換為 FlexMessage
-                    flex_msg = FlexMessage(
-                        alt_text="📊 任務週報",
-                        contents=FlexContainer.from_json(json.dumps(result))
-                    )
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[flex_msg]
-                        )
-                    )
-        
-            except Exception as e:
-                # 捕捉錯誤
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[TextMessage(text=f"❌ 發送週報時發生錯誤：{str(e)}")]
-                    )
-                )
-            return
-
-        if user_message == "生成專案報表":
-            from project_summary_report import generate_project_summary
-
-            # 先查 group 對應的 project_id（跟 weekly_report 做法一樣）
-            project_res = supabase_client.table("projects").select("id") \
-                .eq("group_id", group_id).order("created_at", desc=True).limit(1).execute()
-
-            if not project_res.data:
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[TextMessage(text="⚠️ 找不到群組中的專案，請先建立一個專案")]
-                    )
-                )
-                return
-
-            project_id = project_res.data[0]["id"]
-            result = generate_project_summary(project_id)
-
-            # 回覆 Flex 報表
-            if isinstance(result, str):
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[TextMessage(text=result)]
-                    )
-                )
-            else:
-                flex_msg = FlexMessage(
-                    alt_text="🗃️ 專案總結報表",
-                    contents=FlexContainer.from_json(json.dumps(result))
-                )
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[flex_msg]
-                    )
-                )
-                return
-
-        # 分享資源
-        if user_message.startswith("#分享"):
-            try:
-                project_res = supabase_client.table("projects").select("id") \
-                    .eq("group_id", group_id).order("created_at", desc=True).limit(1).execute()
-                if not project_res.data:
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[TextMessage(text="⚠️ 找不到群組中的專案，請先建立一個專案")]
-                        )
-                    )
-                    return
-        
-                project_id = project_res.data[0]["id"]
-                result = handle_share_message(user_message, user_id, project_id)
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[TextMessage(text=result)]
-                    )
-                )
-                return
-        
-            except Exception as e:
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[TextMessage(text=f"❌ 分享過程中發生錯誤：{str(e)}")]
-                    )
-                )
-                return
-
-        
-        # **檢查使用者是否正在輸入「專案階段數量」**
-        if user_id in user_state and user_state[user_id]["step"] == "waiting_for_stage_count":
-            project_name = user_state[user_id]["project_name"]
-
-            # **確保輸入是數字**
-            if user_message.isdigit():
-                stage_count = int(user_message)
-
-                # **手動產生 UUID 作為 project_id**
-                project_id = str(uuid.uuid4())
-
-                # **儲存到 Supabase**
-                try:
-                    project_response = supabase_client.table("projects").insert({
-                        "id": project_id,  # ✅ **手動設定 UUID**
-                        "name": project_name,
-                        "stage_count": stage_count,  # **存入階段數量**
-                        "created_by": user_id,  # ✅ **存入 LINE 使用者 ID**
-                        "group_id": group_id  # ✅ **存入群組 ID**
-                    }).execute()
-
-                    if project_response.data:
-                        print(f"✅ 專案已建立，UUID: {project_id}")  # Debug log
-                        reply_messages = [
-                            TextMessage(text=f"✅ 專案『{project_name}』已建立，共{stage_count}個階段！\n成員可根據範例輸入學號姓名加入！"),
-                            TextMessage(text="111219060／王曉明／加入專案")
-                        ]
-                    else:
-                        reply_text = "⚠️ 無法建立專案，請稍後再試。"
-
-                except Exception as e:
-                    reply_text = f"❌ 建立專案失敗: {str(e)}"
-
-                # **清除狀態**
-                del user_state[user_id]
-
-            else:
-                reply_text = "⚠️ 請用阿拉伯數字輸入階段數量（此次課程請輸入4）："
-
-            # **回覆用戶**
-            line_bot_api.reply_message_with_http_info(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=reply_messages
-                )
-            )
-            return
-
-        # **讓使用者加入當前群組的最新專案**
-        if "／加入專案" in user_message:  # ✅ 確保訊息格式正確
-            try:
-                parts = user_message.split("／")
-                if len(parts) != 3:
-                    reply_text = "⚠️ 格式錯誤！請輸入【學號／姓名／加入專案】，例如：111234001／王曉明／加入專案"
-                else:
-                    student_id = parts[0].strip()
-                    real_name = parts[1].strip()
-
-                    # **查詢該群組的最新專案**
-                    project_response = supabase_client.table("projects").select("id").eq("group_id", group_id).order("created_at", desc=True).limit(1).execute()
-
-                    if not project_response.data:
-                        reply_text = "⚠️ 目前你的群組沒有任何專案，請先讓管理員建立專案！"
-                    else:
-                        project_id = project_response.data[0]["id"]  # ✅ 取得該群組最新專案 ID
-                        
-                        # **檢查這個使用者是否已經加入專案**
-                        existing_member = supabase_client.table("project_members").select("*").eq("user_id", user_id).eq("project_id", project_id).execute()
-
-                        if existing_member.data:
-                            reply_text = "⚠️ 你已經加入此專案，無需重複加入！"
-                        else:
-                            # **讓使用者手動加入**
-                            member_data = {
-                                "project_id": project_id,
-                                "user_id": user_id,
-                                "student_id": student_id,  # ✅ 存入學號
-                                "real_name": real_name  # ✅ 存入真實姓名
-                            }
-                            response = supabase_client.table("project_members").insert(member_data).execute()
-                            reply_text = f"✅ 你已成功加入專案！\n學號：{student_id}\n姓名：{real_name}\n https://project-piaopiao-v1.vercel.app/"
-
-            except Exception as e:
-                reply_text = f"❌ 加入專案失敗: {str(e)}"
-
-            line_bot_api.reply_message_with_http_info(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text=reply_text)]
-                )
-            )
-            return
-
-        # **第一步：使用者輸入「建立專案：XXX」**
-        if user_message.startswith("建立專案："):
-            project_name = user_message.replace("建立專案：", "").strip()
-            
-            if not project_name:
-                reply_text = "⚠️ 請輸入專案名稱，如 ➡️ 建立專案：我的新專案"
-            else:
-                # **記錄使用者狀態，等待輸入階段數量**
-                user_state[user_id] = {"step": "waiting_for_stage_count", "project_name": project_name}
-                
-                reply_text = "📌 請輸入此專案的階段數量（此次課程請輸入4）："
-
-        else:
-            return  # **回覆原訊息**
-
-        # **回覆用戶**
-        line_bot_api.reply_message_with_http_info(
-            ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[TextMessage(text=reply_text)]
-            )
+    user_message = event.message.text.strip()
+    
+    # **判斷訊息來自個人還是群組**
+    user_id = event.source.user_id if hasattr(event.source, "user_id") else None
+    group_id = event.source.group_id if hasattr(event.source, "group_id") else None
+
+    print(f"📩 收到的訊息內容: {user_message}")  # 確認收到的訊息
+    command = command_for(user_message, user_id, user_state)
+    if command is None:
+        return  # **其他訊息不回覆**
+
+    # **回覆用戶**
+    line_sender.reply_message(
+        ReplyMessageRequest(
+            reply_token=event.reply_token,
+            messages=run_command(command, user_message, user_id, group_id)
         )
+    )
 
 @line_handler.add(PostbackEvent)
 def handle_postback(event):
     """處理 postback 點擊事件"""
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
 
-        data = event.postback.data
-        user_id = event.source.user_id
+    data = event.postback.data
+    user_id = event.source.user_id
 
-        print(f"🟡 收到 Postback：{data}（來自 {user_id}）")
+    print(f"🟡 收到 Postback：{data}（來自 {user_id}）")
 
-        if data == "explain_share":
-            reply_text = "請根據「#分享 名稱 標籤 相關連結 描述（選填）」格式輸入想分享的資源或工具，如「#分享 Figma UI/UX https://www.figma.com/ 視覺設計工具」"
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text=reply_text)]
-                )
+    if data == "explain_share":
+        line_sender.reply_message(
+            ReplyMessageRequest(
+                reply_token=event.reply_token,
+                messages=text_messages(SHARE_HELP_TEXT)
             )
+        )
 
 @app.route("/send_project_summary", methods=["POST"])
 def send_project_summary():
     from project_summary_report import generate_project_summary
-    from linebot.v3.messaging import PushMessageRequest, FlexMessage, FlexContainer
 
     try:
         data = request.get_json()
@@ -414,15 +257,7 @@ def send_project_summary():
         if isinstance(result, str):
             return { "success": False, "message": result }, 500
 
-        flex_msg = FlexMessage(
-            alt_text="🗃️ 專案總結報表",
-            contents=FlexContainer.from_json(json.dumps(result))
-        )
-
-        with ApiClient(configuration) as api_client:
-            MessagingApi(api_client).push_message(
-                PushMessageRequest(to=group_id, messages=[flex_msg])
-            )
+        line_sender.send(group_id, report_message(result, PROJECT_SUMMARY_ALT_TEXT))
 
         return { "success": True }
 
@@ -430,6 +265,33 @@ def send_project_summary():
         print("❌ 報表推送失敗:", e)
         return { "success": False, "message": str(e) }, 500
 
+@app.route("/reconcile_member_stats", methods=["GET", "POST"])
+def reconcile_member_stats():
+    """由 Vercel Cron 定期呼叫，從原始資料表重建成員統計以修正偏差"""
+    from member_stats import reconcile_member_stats as reconcile
+
+    # 未設定 CRON_SECRET 時一律拒絕，避免任何人都能觸發全表重建
+    cron_secret = os.getenv("CRON_SECRET")
+    if not cron_secret:
+        print("❌ 未設定 CRON_SECRET，拒絕重建成員統計")
+        abort(503)
+    if request.headers.get("Authorization") != f"Bearer {cron_secret}":
+        abort(401)
+
+    try:
+        project_id = request.args.get("project_id")
+        fixed = reconcile(project_id)
+        print(f"✅ 成員統計重建完成，修正 {fixed} 筆")
+        return { "success": True, "fixed": fixed }
+    except Exception as e:
+        print("❌ 成員統計重建失敗:", e)
+        return { "success": False, "message": str(e) }, 500
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """LINE 發送器的佇列深度與重試次數"""
+    return line_sender.metrics()
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,287 @@
+"""非同步（ASGI）服務模式
+
+/callback 與 /send_project_summary 使用 AsyncClient（Supabase）與 AsyncMessagingApi（LINE），
+等待 I/O 時不佔用執行緒，單一行程即可同時處理數百個請求。原本的 Flask 入口（app.py）不受影響。
+指令的判斷、解析與回覆內容都在 bot_commands.py，與 app.py 共用，這裡只負責以 await 執行 I/O。
+
+啟動方式：
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import os
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from linebot.v3 import WebhookParser
+from linebot.v3.exceptions import InvalidSignatureError
+from linebot.v3.messaging import (
+    Configuration,
+    ReplyMessageRequest
+)
+from linebot.v3.webhooks import MessageEvent, TextMessageContent, PostbackEvent
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from supabase import acreate_client
+
+from bot_commands import (
+    NO_PROJECT_TEXT, PIAO_ERROR_TEXT, WEEKLY_REPORT_ERROR, SEARCH_ERROR, SEARCH_FORMAT_TEXT,
+    SHARE_ERROR, SHARE_SAVE_ERROR, SHARE_FORMAT_TEXT, SHARE_HELP_TEXT, STAGE_COUNT_FORMAT_TEXT,
+    PROJECT_CREATE_FAILED_TEXT, PROJECT_CREATE_ERROR, JOIN_FORMAT_TEXT, JOIN_NO_PROJECT_TEXT,
+    JOIN_DUPLICATE_TEXT, JOIN_ERROR,
+    START_ALT_TEXT, PIAO_ALT_TEXT, WEEKLY_REPORT_ALT_TEXT, PROJECT_SUMMARY_ALT_TEXT,
+    command_for, load_flex, report_message, text_messages,
+    latest_project_query, project_resources_query, existing_member_query, first_id,
+    parse_search, parse_share, shared_text, start_project, parse_stage_count,
+    project_created_messages, parse_join, new_member, joined_text
+)
+from line_sender import AsyncLineSender
+from resource_search import ResourceIndexCache, format_search_results
+from project_summary_report import generate_project_summary_async
+from weekly_report import generate_weekly_report_async
+
+# 讀取 .env 環境變數
+load_dotenv()
+
+# 設定 LINE API
+configuration = Configuration(
+    host=os.getenv('LINE_API_HOST', 'https://api.line.me'),
+    access_token=os.getenv('CHANNEL_ACCESS_TOKEN')
+)
+# 預設連線池只有 CPU 數 × 5，會限制同時進行中的 LINE 請求數
+configuration.connection_pool_maxsize = int(os.getenv('LINE_CONNECTION_POOL_SIZE', 200))
+parser = WebhookParser(os.getenv('CHANNEL_SECRET'))
+line_sender = AsyncLineSender(configuration)
+
+# Supabase AsyncClient 需在 event loop 內建立，於 lifespan 中初始化
+supabase_client = None
+
+# **使用字典來存放用戶的對話狀態**
+user_state = {}
+
+# **#搜尋 用的分享資源索引（依專案 LRU 快取）**
+resource_indexes = ResourceIndexCache()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global supabase_client
+    supabase_client = await acreate_client(
+        os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    )
+    yield
+    await line_sender.close()
+
+
+async def latest_project_id(group_id):
+    """查詢群組最新的專案 ID，沒有則回傳 None"""
+    return first_id(await latest_project_query(supabase_client, group_id).execute())
+
+
+async def callback(request):
+    """處理來自 LINE 的 Webhook"""
+    signature = request.headers.get('X-Line-Signature')
+    body = (await request.body()).decode("utf-8")
+
+    try:
+        events = parser.parse(body, signature)
+    except InvalidSignatureError:
+        print("❌ 簽名驗證失敗")
+        return PlainTextResponse("Bad Request", status_code=400)
+
+    try:
+        for event in events:
+            if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+                await handle_message(event)
+            elif isinstance(event, PostbackEvent):
+                await handle_postback(event)
+    except Exception as e:
+        print(f"❌ 發生錯誤: {e}")
+        import traceback
+        traceback.print_exc()
+        return PlainTextResponse("Internal Server Error", status_code=500)
+
+    return PlainTextResponse("OK")
+
+
+async def handle_share_message(user_message, line_id, project_id):
+    resource = parse_share(user_message, line_id, project_id)
+    if resource is None:
+        return SHARE_FORMAT_TEXT
+
+    try:
+        await supabase_client.table("shared_resources").insert(resource).execute()
+        resource_indexes.add_resource(project_id, resource)
+        return shared_text(resource)
+    except Exception as e:
+        return SHARE_SAVE_ERROR.format(e)
+
+
+async def handle_search_message(user_message, group_id):
+    """#搜尋 關鍵字：從記憶體索引查詢群組專案分享過的資源"""
+    keyword = parse_search(user_message)
+    if not keyword:
+        return SEARCH_FORMAT_TEXT
+
+    project_id = resource_indexes.project_id_for(group_id)
+    if project_id is None:
+        project_id = await latest_project_id(group_id)
+        if not project_id:
+            return NO_PROJECT_TEXT
+        resource_indexes.set_project_id(group_id, project_id)
+
+    # 索引不在快取中才查詢資料庫建立
+    index = resource_indexes.get(project_id)
+    if index is None:
+        rows = (await project_resources_query(supabase_client, project_id).execute()).data
+        index = resource_indexes.build(project_id, rows)
+
+    return format_search_results(keyword, index.search(keyword))
+
+
+async def handle_join_message(user_message, user_id, group_id):
+    """學號／姓名／加入專案：讓使用者加入當前群組的最新專案"""
+    parsed = parse_join(user_message)
+    if parsed is None:
+        return JOIN_FORMAT_TEXT
+
+    project_id = await latest_project_id(group_id)
+    if not project_id:
+        return JOIN_NO_PROJECT_TEXT
+
+    if (await existing_member_query(supabase_client, user_id, project_id).execute()).data:
+        return JOIN_DUPLICATE_TEXT
+
+    member = new_member(project_id, user_id, *parsed)
+    await supabase_client.table("project_members").insert(member).execute()
+    return joined_text(member)
+
+
+async def run_command(command, user_message, user_id, group_id):
+    """執行指令（見 bot_commands.command_for），回傳要回覆的訊息；與 app.py 的 run_command 一一對應"""
+    if command == "start":
+        return [load_flex("card.json", START_ALT_TEXT)]
+
+    if command == "piao":
+        try:
+            return [load_flex("piao.json", PIAO_ALT_TEXT)]
+        except Exception as e:
+            print(f"❌ 載入 piao.json 發生錯誤：{e}")
+            return text_messages(PIAO_ERROR_TEXT)
+
+    if command == "weekly_report":
+        try:
+            result = await generate_weekly_report_async(supabase_client, group_id)
+            return [report_message(result, WEEKLY_REPORT_ALT_TEXT)]
+        except Exception as e:
+            return text_messages(WEEKLY_REPORT_ERROR.format(e))
+
+    if command == "project_summary":
+        project_id = await latest_project_id(group_id)
+        if not project_id:
+            return text_messages(NO_PROJECT_TEXT)
+        result = await generate_project_summary_async(supabase_client, project_id)
+        return [report_message(result, PROJECT_SUMMARY_ALT_TEXT)]
+
+    if command == "search":
+        try:
+            return text_messages(await handle_search_message(user_message, group_id))
+        except Exception as e:
+            return text_messages(SEARCH_ERROR.format(e))
+
+    if command == "share":
+        try:
+            project_id = await latest_project_id(group_id)
+            if not project_id:
+                return text_messages(NO_PROJECT_TEXT)
+            return text_messages(await handle_share_message(user_message, user_id, project_id))
+        except Exception as e:
+            return text_messages(SHARE_ERROR.format(e))
+
+    if command == "stage_count":
+        project = parse_stage_count(user_message, user_id, group_id, user_state)
+        if project is None:
+            return text_messages(STAGE_COUNT_FORMAT_TEXT)
+        try:
+            if not (await supabase_client.table("projects").insert(project).execute()).data:
+                return text_messages(PROJECT_CREATE_FAILED_TEXT)
+        except Exception as e:
+            return text_messages(PROJECT_CREATE_ERROR.format(e))
+        print(f"✅ 專案已建立，UUID: {project['id']}")
+        resource_indexes.set_project_id(group_id, project["id"])
+        return project_created_messages(project)
+
+    if command == "join":
+        try:
+            return text_messages(await handle_join_message(user_message, user_id, group_id))
+        except Exception as e:
+            return text_messages(JOIN_ERROR.format(e))
+
+    if command == "create_project":
+        return text_messages(start_project(user_message, user_id, user_state))
+
+
+async def handle_message(event):
+    """處理 LINE 訊息"""
+    user_message = event.message.text.strip()
+    user_id = event.source.user_id if hasattr(event.source, "user_id") else None
+    group_id = event.source.group_id if hasattr(event.source, "group_id") else None
+
+    command = command_for(user_message, user_id, user_state)
+    if command is None:
+        return
+
+    await line_sender.reply_message(ReplyMessageRequest(
+        reply_token=event.reply_token,
+        messages=await run_command(command, user_message, user_id, group_id)
+    ))
+
+
+async def handle_postback(event):
+    """處理 postback 點擊事件"""
+    data = event.postback.data
+    print(f"🟡 收到 Postback：{data}（來自 {event.source.user_id}）")
+
+    if data == "explain_share":
+        await line_sender.reply_message(ReplyMessageRequest(
+            reply_token=event.reply_token, messages=text_messages(SHARE_HELP_TEXT)
+        ))
+
+
+async def send_project_summary(request):
+    try:
+        data = await request.json()
+        project_id = data.get("project_id")
+        group_id = data.get("group_id")
+
+        if not project_id or not group_id:
+            return JSONResponse({ "success": False, "message": "缺少 project_id 或 group_id" }, status_code=400)
+
+        result = await generate_project_summary_async(supabase_client, project_id)
+        if isinstance(result, str):
+            return JSONResponse({ "success": False, "message": result }, status_code=500)
+
+        await line_sender.send(group_id, report_message(result, PROJECT_SUMMARY_ALT_TEXT))
+
+        return JSONResponse({ "success": True })
+
+    except Exception as e:
+        print("❌ 報表推送失敗:", e)
+        return JSONResponse({ "success": False, "message": str(e) }, status_code=500)
+
+
+async def metrics(request):
+    """LINE 發送器的佇列深度與重試次數"""
+    return JSONResponse(line_sender.metrics())
+
+
+app = Starlette(
+    routes=[
+        Route("/callback", callback, methods=["POST"]),
+        Route("/send_project_summary", send_project_summary, methods=["POST"]),
+        Route("/metrics", metrics, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,185 @@
+"""LINE 指令的共用邏輯（app.py 的 Flask 入口與 asgi.py 的 ASGI 入口共用）
+
+這裡負責判斷指令、解析訊息、組出要寫入的資料與查詢、產生回覆內容，不直接執行 I/O；
+Supabase 查詢由各入口自行 execute()（同步）或 await execute()（非同步），兩邊行為因此一致。
+"""
+import json
+import re
+import uuid
+from datetime import datetime
+
+from linebot.v3.messaging import TextMessage, FlexMessage, FlexContainer
+
+# **回覆文字**
+NO_PROJECT_TEXT = "⚠️ 找不到群組中的專案，請先建立一個專案"
+PIAO_ERROR_TEXT = "❌ 無法載入飄飄畫面，請稍後再試！"
+WEEKLY_REPORT_ERROR = "❌ 發送週報時發生錯誤：{}"
+SEARCH_ERROR = "❌ 搜尋過程中發生錯誤：{}"
+SEARCH_FORMAT_TEXT = "❗️格式錯誤，請使用：#搜尋 關鍵字或標籤"
+SHARE_ERROR = "❌ 分享過程中發生錯誤：{}"
+SHARE_SAVE_ERROR = "❌ 儲存失敗：{}"
+SHARE_FORMAT_TEXT = "❗️格式錯誤，請使用：#分享 資源名稱 標籤 連結 描述（描述可省略）"
+SHARE_HELP_TEXT = "請根據「#分享 名稱 標籤 相關連結 描述（選填）」格式輸入想分享的資源或工具，如「#分享 Figma UI/UX https://www.figma.com/ 視覺設計工具」\n分享過的資源可用「#搜尋 關鍵字或標籤」找回"
+STAGE_COUNT_PROMPT = "📌 請輸入此專案的階段數量（此次課程請輸入4）："
+STAGE_COUNT_FORMAT_TEXT = "⚠️ 請用阿拉伯數字輸入階段數量（此次課程請輸入4）："
+PROJECT_CREATE_FAILED_TEXT = "⚠️ 無法建立專案，請稍後再試。"
+PROJECT_CREATE_ERROR = "❌ 建立專案失敗: {}"
+PROJECT_NAME_MISSING_TEXT = "⚠️ 請輸入專案名稱，如 ➡️ 建立專案：我的新專案"
+JOIN_FORMAT_TEXT = "⚠️ 格式錯誤！請輸入【學號／姓名／加入專案】，例如：111234001／王曉明／加入專案"
+JOIN_NO_PROJECT_TEXT = "⚠️ 目前你的群組沒有任何專案，請先讓管理員建立專案！"
+JOIN_DUPLICATE_TEXT = "⚠️ 你已經加入此專案，無需重複加入！"
+JOIN_ERROR = "❌ 加入專案失敗: {}"
+
+# **Flex 訊息的替代文字**
+START_ALT_TEXT = "計畫飄飄👻 開始使用說明"
+PIAO_ALT_TEXT = "呼叫飄飄👻"
+WEEKLY_REPORT_ALT_TEXT = "📊 任務週報"
+PROJECT_SUMMARY_ALT_TEXT = "🗃️ 專案總結報表"
+
+SHARE_RE = re.compile(r"#分享\s+(\S+)\s+(\S+)\s+(https?://\S+)(?:\s+(.*))?")
+
+
+def command_for(user_message, user_id, user_state):
+    """判斷訊息對應的指令，不需回覆時回傳 None（判斷順序即指令的優先順序）"""
+    if user_message == "開始使用":
+        return "start"
+    if user_message == "呼叫飄飄":
+        return "piao"
+    if user_message == "本週結算":
+        return "weekly_report"
+    if user_message == "生成專案報表":
+        return "project_summary"
+    if user_message.startswith("#搜尋"):
+        return "search"
+    if user_message.startswith("#分享"):
+        return "share"
+    if user_id in user_state and user_state[user_id]["step"] == "waiting_for_stage_count":
+        return "stage_count"
+    if "／加入專案" in user_message:
+        return "join"
+    if user_message.startswith("建立專案："):
+        return "create_project"
+    return None
+
+
+def load_flex(path, alt_text):
+    with open(path, "r", encoding="utf-8") as f:
+        flex_json = json.load(f)
+    return FlexMessage(alt_text=alt_text, contents=FlexContainer.from_json(json.dumps(flex_json)))
+
+
+def report_message(result, alt_text):
+    """週報 / 專案報表的產生函式回傳錯誤訊息（字串）或 Flex JSON dict"""
+    if isinstance(result, str):
+        return TextMessage(text=result)
+    return FlexMessage(alt_text=alt_text, contents=FlexContainer.from_json(json.dumps(result)))
+
+
+def text_messages(*texts):
+    return [TextMessage(text=text) for text in texts]
+
+
+# ===== Supabase 查詢（同步與非同步的 client 皆可，由呼叫端 execute） =====
+
+def latest_project_query(client, group_id):
+    """群組最新的專案"""
+    return client.table("projects").select("id") \
+        .eq("group_id", group_id).order("created_at", desc=True).limit(1)
+
+
+def project_resources_query(client, project_id):
+    """建立搜尋索引用的分享資源"""
+    return client.table("shared_resources") \
+        .select("id, title, tag, link, description, created_at") \
+        .eq("project_id", project_id)
+
+
+def existing_member_query(client, user_id, project_id):
+    return client.table("project_members").select("*").eq("user_id", user_id).eq("project_id", project_id)
+
+
+def first_id(res):
+    return res.data[0]["id"] if res.data else None
+
+
+# ===== 各指令的解析與回覆 =====
+
+def parse_search(user_message):
+    """#搜尋 關鍵字：回傳關鍵字（可能為空字串）"""
+    return user_message[len("#搜尋"):].strip()
+
+
+def parse_share(user_message, user_id, project_id):
+    """#分享 名稱 標籤 連結 描述：回傳要寫入 shared_resources 的資料，格式錯誤回傳 None"""
+    match = SHARE_RE.match(user_message)
+    if not match:
+        return None
+
+    title, tag, link, description = match.groups()
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "project_id": project_id,
+        "title": title,
+        "tag": tag,
+        "link": link,
+        "description": description or "",
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+
+def shared_text(resource):
+    return f"✅ 資源「{resource['title']}」已成功分享！"
+
+
+def start_project(user_message, user_id, user_state):
+    """建立專案：XXX —— 記錄使用者狀態等待輸入階段數量，回傳回覆文字"""
+    project_name = user_message.replace("建立專案：", "").strip()
+    if not project_name:
+        return PROJECT_NAME_MISSING_TEXT
+
+    user_state[user_id] = {"step": "waiting_for_stage_count", "project_name": project_name}
+    return STAGE_COUNT_PROMPT
+
+
+def parse_stage_count(user_message, user_id, group_id, user_state):
+    """輸入階段數量：回傳要寫入 projects 的資料並清除狀態；不是數字時回傳 None（保留狀態讓使用者重新輸入）"""
+    if not user_message.isdigit():
+        return None
+
+    project_name = user_state.pop(user_id)["project_name"]
+    return {
+        "id": str(uuid.uuid4()),  # ✅ **手動產生 UUID 作為 project_id**
+        "name": project_name,
+        "stage_count": int(user_message),
+        "created_by": user_id,
+        "group_id": group_id
+    }
+
+
+def project_created_messages(project):
+    return text_messages(
+        f"✅ 專案『{project['name']}』已建立，共{project['stage_count']}個階段！\n成員可根據範例輸入學號姓名加入！",
+        "111219060／王曉明／加入專案"
+    )
+
+
+def parse_join(user_message):
+    """學號／姓名／加入專案：回傳 (學號, 姓名)，格式錯誤回傳 None"""
+    parts = user_message.split("／")
+    if len(parts) != 3:
+        return None
+    return parts[0].strip(), parts[1].strip()
+
+
+def new_member(project_id, user_id, student_id, real_name):
+    return {
+        "project_id": project_id,
+        "user_id": user_id,
+        "student_id": student_id,
+        "real_name": real_name
+    }
+
+
+def joined_text(member):
+    return f"✅ 你已成功加入專案！\n學號：{member['student_id']}\n姓名：{member['real_name']}\n https://project-piaopiao-v1.vercel.app/"
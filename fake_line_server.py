@@ -0,0 +1,112 @@
+"""本機的假 LINE Messaging API，用來測試 LineSender 的限流與重試
+
+使用方式：
+    python fake_line_server.py --port 8080 --fail-rate 0.3
+    LINE_API_HOST=http://localhost:8080 python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+stats = {"push": 0, "reply": 0, "messages": 0, "rejected": 0}
+stats_lock = threading.Lock()
+
+# 每個收到的 push / reply：(kind, 訊息數, X-Line-Retry-Key, 回應狀態碼, 收到時間)
+received = []
+
+
+def make_handler(fail_rate, server_error_rate, retry_after, latency, quiet=False, fail_first=0):
+    """fail_first：前 N 個 push / reply 一律回傳 429（測試用，結果可預期）"""
+    remaining_failures = [fail_first]
+
+    class FakeLineHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 支援 keep-alive，與真實 LINE API 一致
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with stats_lock:
+                    return self._send_json(200, stats)
+            self._send_json(404, {"message": "Not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+
+            kind = {"/v2/bot/message/push": "push", "/v2/bot/message/reply": "reply"}.get(self.path)
+            if kind is None:
+                return self._send_json(404, {"message": "Not found"})
+
+            messages = body.get("messages", [])
+
+            def log(status):
+                with stats_lock:
+                    received.append((kind, len(messages), self.headers.get("X-Line-Retry-Key"), status, time.monotonic()))
+
+            # 模擬網路延遲、LINE 的 429 限流與暫時性 5xx
+            if latency:
+                time.sleep(latency)
+            with stats_lock:
+                forced = remaining_failures[0] > 0
+                if forced:
+                    remaining_failures[0] -= 1
+            roll = random.random()
+            if forced or roll < fail_rate:
+                with stats_lock:
+                    stats["rejected"] += 1
+                log(429)
+                return self._send_json(429, {"message": "The API rate limit has been exceeded."},
+                                       {"Retry-After": str(retry_after)})
+            if roll < fail_rate + server_error_rate:
+                with stats_lock:
+                    stats["rejected"] += 1
+                log(503)
+                return self._send_json(503, {"message": "Service unavailable"})
+
+            if len(messages) > 5:
+                log(400)
+                return self._send_json(400, {"message": "Size must be between 1 and 5"})
+
+            log(200)
+            with stats_lock:
+                stats[kind] += 1
+                stats["messages"] += len(messages)
+            if not quiet:
+                print(f"📨 {kind} → {body.get('to') or body.get('replyToken')}：{len(messages)} 則訊息"
+                      f"（retry key：{self.headers.get('X-Line-Retry-Key')}）")
+            self._send_json(200, {"sentMessages": [{"id": str(random.getrandbits(48))} for _ in messages]})
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeLineHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="假 LINE Messaging API 伺服器")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="回傳 429 的機率")
+    parser.add_argument("--server-error-rate", type=float, default=0.05, help="回傳 503 的機率")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 時的 Retry-After 秒數")
+    parser.add_argument("--quiet", action="store_true", help="不印出每個請求")
+    parser.add_argument("--latency", type=float, default=0, help="每個請求的模擬延遲（秒）")
+    args = parser.parse_args()
+
+    # 預設 listen backlog 只有 5，高併發壓測時會造成連線被拒
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("0.0.0.0", args.port),
+                                 make_handler(args.fail_rate, args.server_error_rate, args.retry_after, args.latency, args.quiet))
+    print(f"👻 假 LINE 伺服器啟動於 http://localhost:{args.port}（GET /stats 查看統計）")
+    server.serve_forever()
@@ -0,0 +1,311 @@
+import asyncio
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import Future
+
+import aiohttp
+import urllib3
+from linebot.v3.messaging import (
+    ApiClient, MessagingApi, AsyncApiClient, AsyncMessagingApi, PushMessageRequest
+)
+from linebot.v3.messaging.exceptions import ApiException
+
+# LINE 單次 push / reply 最多 5 則訊息
+MAX_MESSAGES_PER_REQUEST = 5
+
+# 可重試的 HTTP 狀態碼（429 限流、5xx 暫時性錯誤）
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# reply token 只能使用一次且 reply 沒有 retry key：5xx 時請求可能已被接受，重試只會得到 400
+REPLY_RETRYABLE_STATUS = {429}
+
+
+class TokenBucket:
+    """Token bucket 限流器：每秒補充 rate 個 token，最多累積 capacity 個"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """預約一個 token，回傳需要等待的秒數（0 表示可立即送出）"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+
+def parse_retry_after(e):
+    """從 ApiException 讀取 Retry-After（秒），沒有則回傳 None"""
+    headers = getattr(e, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(e, retryable_status=RETRYABLE_STATUS):
+    if isinstance(e, ApiException):
+        return e.status in retryable_status
+    return isinstance(e, (urllib3.exceptions.HTTPError, aiohttp.ClientError, ConnectionError, TimeoutError))
+
+
+def backoff_delay(attempt, base_delay, max_delay, retry_after=None):
+    """Full jitter 指數退避；若伺服器有給 Retry-After 則至少等待該秒數（最多 max_delay）"""
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return min(delay, max_delay)
+
+
+def chunk_messages(messages):
+    return [messages[i:i + MAX_MESSAGES_PER_REQUEST] for i in range(0, len(messages), MAX_MESSAGES_PER_REQUEST)]
+
+
+class LineSender:
+    """帶有限流、重試與訊息合併的 LINE 發送器
+
+    - reply_message：立即送出，只在 429 或連線錯誤時重試（reply token 只能用一次）
+    - push_message / push：立即送出，遇到 429 / 5xx 會帶同一個 retry key 依退避重試
+    - send：排入佇列後 flush，同時間送往同一對象的訊息會合併成一次 push（每次最多 5 則）
+
+    這些呼叫都在 Webhook / HTTP 請求中進行，每次 reply / push（含所有重試）最多花 timeout 秒，
+    下一次重試會超過期限時直接回報失敗，不會卡住請求直到 reply token 或函式逾時。
+    """
+
+    def __init__(self, configuration, rate=1000, capacity=1000, max_retries=4,
+                 base_delay=0.5, max_delay=30, timeout=10):
+        self.configuration = configuration
+        self.bucket = TokenBucket(rate, capacity)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.queue = defaultdict(deque)
+        self.flushing = set()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "coalesced_messages": 0}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _deadline(self):
+        return time.monotonic() + self.timeout if self.timeout is not None else None
+
+    def _retry_delay(self, e, attempt, retryable_status, deadline):
+        """回傳重試前要等待的秒數；不應重試時回傳 None"""
+        if attempt >= self.max_retries or not is_retryable(e, retryable_status):
+            return None
+        retry_after = parse_retry_after(e)
+        if retry_after is not None and retry_after > self.max_delay:
+            # 伺服器要求等待太久，不在請求處理中卡住，直接回報失敗
+            return None
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay, retry_after)
+        if deadline is not None and time.monotonic() + delay > deadline:
+            # 等待後會超過這次呼叫的期限
+            return None
+        print(f"⚠️ LINE API 暫時失敗（第 {attempt + 1} 次），{delay:.2f} 秒後重試：{getattr(e, 'status', None) or e}")
+        self._count("retries")
+        return delay
+
+    def _call(self, send, retryable_status=RETRYABLE_STATUS, deadline=None):
+        """送出一次 API 呼叫，失敗時依 Retry-After / 指數退避重試（不超過 deadline）"""
+        attempt = 0
+        while True:
+            wait = self.bucket.reserve()
+            if wait:
+                time.sleep(wait)
+            self._count("requests")
+            try:
+                with ApiClient(self.configuration) as api_client:
+                    return send(MessagingApi(api_client))
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, retryable_status, deadline)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    def reply_message(self, reply_message_request):
+        return self._call(lambda api: api.reply_message(reply_message_request),
+                          REPLY_RETRYABLE_STATUS, self._deadline())
+
+    def push_message(self, push_message_request):
+        return self.push(push_message_request.to, push_message_request.messages)
+
+    def push(self, to, messages):
+        """push 訊息；超過 5 則會拆成多次請求，每次都帶上固定的 retry key 避免重複送出"""
+        deadline = self._deadline()
+        for batch in chunk_messages(list(messages)):
+            retry_key = str(uuid.uuid4())
+            self._call(lambda api: api.push_message(
+                PushMessageRequest(to=to, messages=batch),
+                x_line_retry_key=retry_key
+            ), deadline=deadline)
+
+    def queue_message(self, to, message):
+        """暫存訊息，等 flush 時再合併送出；回傳的 Future 會在送出成功或失敗時完成"""
+        future = Future()
+        with self.lock:
+            self.queue[to].append((message, future))
+        return future
+
+    def _targets(self, to):
+        with self.lock:
+            return [to] if to is not None else list(self.queue)
+
+    def _claim(self, target):
+        """同一對象同時只有一個 flush；已有人在送時回傳 False，新排入的訊息會由它在下一輪合併送出"""
+        with self.lock:
+            if target in self.flushing:
+                return False
+            self.flushing.add(target)
+            return True
+
+    def _next_items(self, target):
+        """取出該對象目前所有暫存的訊息；沒有訊息時結束這個對象的 flush
+
+        已取消等待的訊息（例如請求被取消）不再送出，其餘標記為送出中，之後只能由 flush 完成。
+        """
+        with self.lock:
+            items = [(m, f) for m, f in self.queue.pop(target, ()) if f.set_running_or_notify_cancel()]
+            if not items:
+                self.flushing.discard(target)
+        if len(items) > 1:
+            self._count("coalesced_messages", len(items))
+        return items
+
+    @staticmethod
+    def _settle(items, error=None):
+        for _, future in items:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def _abort(self, target, items):
+        """flush 被 BaseException（例如 asyncio.CancelledError）中斷：釋放對象，
+        讓送出中與仍在排隊的訊息都以錯誤結束，避免其他 send 永遠等待"""
+        with self.lock:
+            self.flushing.discard(target)
+            queued = [(m, f) for m, f in self.queue.pop(target, ()) if f.set_running_or_notify_cancel()]
+        self._settle(items + queued, RuntimeError(f"送往 {target} 的 push 被中斷"))
+
+    def flush(self, to=None):
+        """把暫存的訊息依對象合併（每次最多 5 則）後 push"""
+        for target in self._targets(to):
+            if not self._claim(target):
+                continue
+            items = []
+            try:
+                while items := self._next_items(target):
+                    try:
+                        self.push(target, [m for m, _ in items])
+                    except Exception as e:
+                        self._settle(items, e)
+                    else:
+                        self._settle(items)
+            finally:
+                # 正常結束時 items 為空（_next_items 已釋放對象）；否則是 push 途中被中斷
+                if items:
+                    self._abort(target, items)
+
+    def send(self, to, message):
+        """排入佇列並 flush；若其他執行緒正在送同一對象，訊息會與之合併，並等待實際送出的結果"""
+        future = self.queue_message(to, message)
+        self.flush(to)
+        return future.result()
+
+    def metrics(self):
+        with self.lock:
+            return {
+                **self.stats,
+                "queue_depth": sum(len(q) for q in self.queue.values()),
+            }
+
+
+class AsyncLineSender(LineSender):
+    """LineSender 的非同步版本（給 asgi.py 使用），共用同一個 AsyncApiClient 連線池"""
+
+    def __init__(self, configuration, **kwargs):
+        super().__init__(configuration, **kwargs)
+        self.api_client = None
+
+    async def _call(self, send, retryable_status=RETRYABLE_STATUS, deadline=None):
+        if self.api_client is None:
+            self.api_client = AsyncApiClient(self.configuration)
+        api = AsyncMessagingApi(self.api_client)
+
+        attempt = 0
+        while True:
+            wait = self.bucket.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            self._count("requests")
+            try:
+                return await send(api)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, retryable_status, deadline)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def reply_message(self, reply_message_request):
+        return await self._call(lambda api: api.reply_message(reply_message_request),
+                                REPLY_RETRYABLE_STATUS, self._deadline())
+
+    async def push_message(self, push_message_request):
+        return await self.push(push_message_request.to, push_message_request.messages)
+
+    async def push(self, to, messages):
+        deadline = self._deadline()
+        for batch in chunk_messages(list(messages)):
+            retry_key = str(uuid.uuid4())
+            await self._call(lambda api: api.push_message(
+                PushMessageRequest(to=to, messages=batch),
+                x_line_retry_key=retry_key
+            ), deadline=deadline)
+
+    async def flush(self, to=None):
+        for target in self._targets(to):
+            if not self._claim(target):
+                continue
+            items = []
+            try:
+                while items := self._next_items(target):
+                    try:
+                        await self.push(target, [m for m, _ in items])
+                    except Exception as e:
+                        self._settle(items, e)
+                    else:
+                        self._settle(items)
+            finally:
+                if items:
+                    self._abort(target, items)
+
+    async def send(self, to, message):
+        future = self.queue_message(to, message)
+        await self.flush(to)
+        return await asyncio.wrap_future(future)
+
+    async def close(self):
+        if self.api_client is not None:
+            await self.api_client.close()
+            self.api_client = None
@@ -0,0 +1,98 @@
+"""比較 Flask（app.py）與 ASGI（asgi.py）模式的吞吐量
+
+送出帶有正確簽名的 LINE Webhook（預設為「開始使用」訊息），統計每秒請求數與延遲。
+建議搭配 fake_line_server.py 模擬 LINE API 的延遲，例如：
+
+    python fake_line_server.py --port 8080 --fail-rate 0 --server-error-rate 0 --latency 0.2 --quiet
+    LINE_API_HOST=http://localhost:8080 python app.py                                  # Flask，port 5000
+    LINE_API_HOST=http://localhost:8080 uvicorn asgi:app --port 5001                    # ASGI
+    python load_test.py http://localhost:5000 --concurrency 200 --requests 1000
+    python load_test.py http://localhost:5001 --concurrency 200 --requests 1000
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def webhook_body(text):
+    return json.dumps({
+        "destination": "Uload",
+        "events": [{
+            "type": "message",
+            "mode": "active",
+            "timestamp": int(time.time() * 1000),
+            "source": {"type": "group", "groupId": "Cload", "userId": "Uload"},
+            "webhookEventId": "01LOADTEST",
+            "deliveryContext": {"isRedelivery": False},
+            "replyToken": "load-test-reply-token",
+            "message": {"id": "1", "type": "text", "quoteToken": "q", "text": text}
+        }]
+    }, ensure_ascii=False)
+
+
+def sign(body, secret):
+    digest = hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+async def run(base_url, path, concurrency, total, text):
+    body = webhook_body(text)
+    headers = {
+        "Content-Type": "application/json",
+        "X-Line-Signature": sign(body, os.getenv("CHANNEL_SECRET", "")),
+    }
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(base_url=base_url, connector=connector, timeout=timeout) as session:
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    async with session.post(path, data=body.encode("utf-8"), headers=headers) as res:
+                        await res.read()
+                        status = res.status
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"🎯 {base_url}{path}  併發 {concurrency}，共 {total} 個請求")
+    print(f"⏱️ 總耗時 {elapsed:.2f} 秒，吞吐量 {total / elapsed:.1f} req/s")
+    print(f"📈 延遲 p50 {latencies[len(latencies) // 2] * 1000:.0f} ms，"
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms，"
+          f"max {latencies[-1] * 1000:.0f} ms")
+    print(f"📊 狀態碼：{statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Webhook 吞吐量測試")
+    parser.add_argument("base_url", help="例如 http://localhost:5000")
+    parser.add_argument("--path", default="/callback")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--text", default="開始使用", help="Webhook 內的訊息文字")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.base_url, args.path, args.concurrency, args.requests, args.text))
@@ -0,0 +1,24 @@
+import os
+import argparse
+from supabase import create_client
+from dotenv import load_dotenv
+
+# 讀取環境變數
+load_dotenv()
+supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+
+def reconcile_member_stats(project_id=None):
+    """從原始資料表重建 project_member_stats（觸發器維護的累計統計），回傳被修正的列數
+
+    project_id 為 None 時重建所有專案。
+    """
+    res = supabase.rpc("rebuild_project_member_stats", {"p_project_id": project_id}).execute()
+    return res.data
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重建專案成員統計，修正累計值的偏差")
+    parser.add_argument("project_id", nargs="?", help="只重建指定專案（預設為全部）")
+    args = parser.parse_args()
+
+    fixed = reconcile_member_stats(args.project_id)
+    print(f"✅ 成員統計已重建，修正 {fixed} 筆")
@@ -1,6 +1,7 @@
 
 import os
 import json
+import asyncio
 from datetime import datetime, timedelta
 from supabase import create_client
 from dotenv import load_dotenv
@@ -13,6 +14,80 @@ def format_tw_date(iso_str):
     dt = datetime.fromisoformat(iso_str.replace("Z", "+00:00")) + timedelta(hours=8)
     return dt.strftime("%m/%d")
 
+# 報表讀取的成員統計（由資料庫觸發器維護，見 supabase/migrations）
+MEMBER_REPORT_COLUMNS = "user_id, real_name, attribute_tags, task_total, task_completed, " \
+    "resource_count, comment_count, rating_sum, rating_count"
+
+def members_from_report(report_rows):
+    """把 project_member_report 的資料轉成報表用的成員統計"""
+    return {
+        r["user_id"]: {
+            "name": r["real_name"],
+            "attributes": " ".join(f"#{tag}" for tag in (r.get("attribute_tags") or [])),
+            "task_total": r["task_total"],
+            "task_completed": r["task_completed"],
+            "resource_count": r["resource_count"],
+            "comment_count": r["comment_count"],
+            "rating_sum": r["rating_sum"],
+            "rating_count": r["rating_count"],
+        } for r in report_rows
+    }
+
+def summarize_members(member_rows, task_rows, checklist_rows, rating_rows, resource_rows, reply_rows):
+    """把查詢結果整理成每位成員的統計"""
+    members = {
+        m["user_id"]: {
+            "name": m["real_name"],
+            "attributes": " ".join(f"#{tag}" for tag in (m.get("attribute_tags") or [])),
+            "task_total": 0,
+            "task_completed": 0,
+            "resource_count": 0,
+            "comment_count": 0,
+            "rating_sum": 0,
+            "rating_count": 0,
+        } for m in member_rows
+    }
+
+    # 任務
+    task_map = {}
+    for t in task_rows:
+        uid = t["assignee_id"]
+        if uid in members:
+            members[uid]["task_total"] += 1
+            task_map[t["id"]] = uid
+
+    # 任務完成情況
+    checklist_map = {}
+    for c in checklist_rows:
+        checklist_map.setdefault(c["task_id"], []).append(c["is_done"])
+
+    for tid, checks in checklist_map.items():
+        if all(checks):
+            uid = task_map[tid]
+            members[uid]["task_completed"] += 1
+
+    # 評分（根據 task_id 找出 assignee）
+    for f in rating_rows:
+        task_id = f["task_id"]
+        uid = task_map.get(task_id)
+        if uid in members and f.get("rating") is not None:
+            members[uid]["rating_sum"] += f["rating"]
+            members[uid]["rating_count"] += 1
+
+    # 資源
+    for r in resource_rows:
+        uid = r["user_id"]
+        if uid in members:
+            members[uid]["resource_count"] += 1
+
+    # 留言
+    for r in reply_rows:
+        uid = r["user_id"]
+        if uid in members:
+            members[uid]["comment_count"] += 1
+
+    return members
+
 def generate_project_summary(project_id):
     try:
         # 查詢專案資料（包含建立和完成日期）
@@ -20,157 +95,166 @@ def generate_project_summary(project_id):
             .select("name, created_at, completed_at") \
             .eq("id", project_id).maybe_single().execute()
 
-        if not project_res.data:
+        if not project_res or not project_res.data:
             return "❌ 找不到指定專案"
 
-        project = project_res.data
-        name = project["name"]
-        created = format_tw_date(project["created_at"])
-        completed = format_tw_date(project["completed_at"]) if project["completed_at"] else created
-        date_range = f"{created} - {completed}"
+        # 讀取已累計的成員統計；若尚未套用 migration 則改為從原始資料計算
+        try:
+            report_res = supabase.table("project_member_report").select(MEMBER_REPORT_COLUMNS) \
+                .eq("project_id", project_id).execute()
+        except Exception as e:
+            print(f"⚠️ 讀取 project_member_report 失敗，改為從原始資料計算：{e}")
+            report_res = None
 
-        # 查詢成員
+        if report_res is not None:
+            return render_project_summary(project_res.data, members_from_report(report_res.data))
+
+        # 查詢成員與任務
         members_res = supabase.table("project_members") \
             .select("user_id, real_name, attribute_tags") \
             .eq("project_id", project_id).execute()
-
-        members = {
-            m["user_id"]: {
-                "name": m["real_name"],
-                "attributes": " ".join(f"#{tag}" for tag in (m.get("attribute_tags") or [])),
-                "task_total": 0,
-                "task_completed": 0,
-                "resource_count": 0,
-                "comment_count": 0,
-                "rating_sum": 0,
-                "rating_count": 0,
-            } for m in members_res.data
-        }
-
-        # 查詢任務
         task_res = supabase.table("tasks").select("id, assignee_id").eq("project_id", project_id).execute()
-        task_map = {}
-        for t in task_res.data:
-            uid = t["assignee_id"]
-            if uid in members:
-                members[uid]["task_total"] += 1
-                task_map[t["id"]] = uid
-
-        # 任務完成情況
-        checklist_res = supabase.table("task_checklists").select("task_id, is_done").in_("task_id", list(task_map)).execute()
-        checklist_map = {}
-        for c in checklist_res.data:
-            checklist_map.setdefault(c["task_id"], []).append(c["is_done"])
-
-        for tid, checks in checklist_map.items():
-            if all(checks):
-                uid = task_map[tid]
-                members[uid]["task_completed"] += 1
-
-        # 評分（根據 task_id 找出 assignee）
-        rating_res = supabase.table("task_feedbacks").select("task_id, rating").in_("task_id", list(task_map)).eq("is_reflection", False).execute()
-        for f in rating_res.data:
-            task_id = f["task_id"]
-            uid = task_map.get(task_id)
-            if uid in members and f.get("rating") is not None:
-                members[uid]["rating_sum"] += f["rating"]
-                members[uid]["rating_count"] += 1
-
-        # 資源
-        resource_res = supabase.table("shared_resources").select("user_id").eq("project_id", project_id).execute()
-        for r in resource_res.data:
-            uid = r["user_id"]
-            if uid in members:
-                members[uid]["resource_count"] += 1
+        member_ids = {m["user_id"] for m in members_res.data}
+        task_ids = [t["id"] for t in task_res.data if t["assignee_id"] in member_ids]
 
-        # 留言
+        checklist_res = supabase.table("task_checklists").select("task_id, is_done").in_("task_id", task_ids).execute()
+        rating_res = supabase.table("task_feedbacks").select("task_id, rating").in_("task_id", task_ids).eq("is_reflection", False).execute()
+        resource_res = supabase.table("shared_resources").select("user_id").eq("project_id", project_id).execute()
         reply_res = supabase.table("resource_replies").select("user_id").execute()
-        for r in reply_res.data:
-            uid = r["user_id"]
-            if uid in members:
-                members[uid]["comment_count"] += 1
-
-        # 套用樣板
-        with open("project_summary_template.json", "r", encoding="utf-8") as f:
-            template = json.load(f)
-
-        # ⬆️ 標題與日期
-        template["body"]["contents"][1]["text"] = date_range
-
-        # ⬆️ 專案資訊
-        details = template["body"]["contents"][3]["contents"]
-        details[0]["contents"][1]["text"] = name
-        details[1]["contents"][1]["text"] = f"{sum(m['task_total'] for m in members.values())} 項"
-        details[2]["contents"][1]["text"] = f"{sum(m['resource_count'] for m in members.values())} 項"
-        details[3]["contents"][1]["text"] = "、".join(m["name"] for m in members.values())
-
-        # 移除樣板後續所有 block（保留前 5 個：標題、日期、分隔線、專案摘要區塊、下分隔線）
-        template["body"]["contents"] = template["body"]["contents"][:5]
-
-        # ⬇️ 成員統計
-        for i, m in enumerate(members.values()):
-            rating = f"⭐ {round(m['rating_sum']/m['rating_count'], 1)}" if m["rating_count"] > 0 else "—"
-            block = [
-                { "type": "text", "text": m["name"], "color": "#153448", "size": "md" },
-                {
-                    "type": "box", "layout": "horizontal", "contents": [
-                        { "type": "text", "text": "專案角色屬性", "size": "sm", "color": "#153448", "flex": 0 },
-                        { "type": "text", "text": m["attributes"] or "—", "size": "sm", "color": "#153448", "align": "end", "margin": "md", "wrap": True }
-                    ]
-                },
-                {
-                    "type": "box", "layout": "horizontal", "contents": [
-                        { "type": "text", "text": "任務完成數與總數", "size": "sm", "color": "#153448", "flex": 0 },
-                        { "type": "text", "text": f"{m['task_completed']} / {m['task_total']}", "size": "sm", "color": "#153448", "align": "end" }
-                    ]
-                },
-                {
-                    "type": "box", "layout": "horizontal", "contents": [
-                        { "type": "text", "text": "分享專案資源數", "size": "sm", "color": "#153448", "flex": 0 },
-                        { "type": "text", "text": f"{m['resource_count']} 項", "size": "sm", "color": "#153448", "align": "end" }
-                    ]
-                },
-                {
-                    "type": "box", "layout": "horizontal", "contents": [
-                        { "type": "text", "text": "建議與反思留言數", "size": "sm", "color": "#153448", "flex": 0 },
-                        { "type": "text", "text": f"{m['comment_count']} 次", "size": "sm", "color": "#153448", "align": "end" }
-                    ]
-                },
-                {
-                    "type": "box", "layout": "horizontal", "contents": [
-                        { "type": "text", "text": "任務平均評分", "size": "sm", "color": "#153448" },
-                        { "type": "text", "text": rating, "size": "sm", "color": "#153448", "align": "end" }
-                    ]
-                }
-            ]
-            # 第一位成員不加 separator
-            if i > 0:
-                template["body"]["contents"].append({ "type": "separator", "margin": "lg" })
-            template["body"]["contents"].append({ "type": "box", "layout": "vertical", "margin": "lg", "spacing": "sm", "contents": block })
-
-        # 最後感謝區塊
-        template["body"]["contents"] += [
-            { "type": "separator", "margin": "lg" },
+
+        members = summarize_members(members_res.data, task_res.data, checklist_res.data,
+                                    rating_res.data, resource_res.data, reply_res.data)
+        return render_project_summary(project_res.data, members)
+
+    except Exception as e:
+        return f"❌ 生成報表失敗: {str(e)}"
+
+async def generate_project_summary_async(client, project_id):
+    """generate_project_summary 的非同步版本，client 為 supabase AsyncClient"""
+    try:
+        project_res = await client.table("projects") \
+            .select("name, created_at, completed_at") \
+            .eq("id", project_id).maybe_single().execute()
+
+        if not project_res or not project_res.data:
+            return "❌ 找不到指定專案"
+
+        try:
+            report_res = await client.table("project_member_report").select(MEMBER_REPORT_COLUMNS) \
+                .eq("project_id", project_id).execute()
+        except Exception as e:
+            print(f"⚠️ 讀取 project_member_report 失敗，改為從原始資料計算：{e}")
+            report_res = None
+
+        if report_res is not None:
+            return render_project_summary(project_res.data, members_from_report(report_res.data))
+
+        members_res, task_res, resource_res, reply_res = await asyncio.gather(
+            client.table("project_members").select("user_id, real_name, attribute_tags").eq("project_id", project_id).execute(),
+            client.table("tasks").select("id, assignee_id").eq("project_id", project_id).execute(),
+            client.table("shared_resources").select("user_id").eq("project_id", project_id).execute(),
+            client.table("resource_replies").select("user_id").execute(),
+        )
+        member_ids = {m["user_id"] for m in members_res.data}
+        task_ids = [t["id"] for t in task_res.data if t["assignee_id"] in member_ids]
+
+        checklist_res, rating_res = await asyncio.gather(
+            client.table("task_checklists").select("task_id, is_done").in_("task_id", task_ids).execute(),
+            client.table("task_feedbacks").select("task_id, rating").in_("task_id", task_ids).eq("is_reflection", False).execute(),
+        )
+
+        members = summarize_members(members_res.data, task_res.data, checklist_res.data,
+                                    rating_res.data, resource_res.data, reply_res.data)
+        return render_project_summary(project_res.data, members)
+
+    except Exception as e:
+        return f"❌ 生成報表失敗: {str(e)}"
+
+def render_project_summary(project, members):
+    """把專案資料與成員統計套進 Flex 樣板"""
+    name = project["name"]
+    created = format_tw_date(project["created_at"])
+    completed = format_tw_date(project["completed_at"]) if project["completed_at"] else created
+    date_range = f"{created} - {completed}"
+
+    # 套用樣板
+    with open("project_summary_template.json", "r", encoding="utf-8") as f:
+        template = json.load(f)
+
+    # ⬆️ 標題與日期
+    template["body"]["contents"][1]["text"] = date_range
+
+    # ⬆️ 專案資訊
+    details = template["body"]["contents"][3]["contents"]
+    details[0]["contents"][1]["text"] = name
+    details[1]["contents"][1]["text"] = f"{sum(m['task_total'] for m in members.values())} 項"
+    details[2]["contents"][1]["text"] = f"{sum(m['resource_count'] for m in members.values())} 項"
+    details[3]["contents"][1]["text"] = "、".join(m["name"] for m in members.values())
+
+    # 移除樣板後續所有 block（保留前 5 個：標題、日期、分隔線、專案摘要區塊、下分隔線）
+    template["body"]["contents"] = template["body"]["contents"][:5]
+
+    # ⬇️ 成員統計
+    for i, m in enumerate(members.values()):
+        rating = f"⭐ {round(m['rating_sum']/m['rating_count'], 1)}" if m["rating_count"] > 0 else "—"
+        block = [
+            { "type": "text", "text": m["name"], "color": "#153448", "size": "md" },
+            {
+                "type": "box", "layout": "horizontal", "contents": [
+                    { "type": "text", "text": "專案角色屬性", "size": "sm", "color": "#153448", "flex": 0 },
+                    { "type": "text", "text": m["attributes"] or "—", "size": "sm", "color": "#153448", "align": "end", "margin": "md", "wrap": True }
+                ]
+            },
+            {
+                "type": "box", "layout": "horizontal", "contents": [
+                    { "type": "text", "text": "任務完成數與總數", "size": "sm", "color": "#153448", "flex": 0 },
+                    { "type": "text", "text": f"{m['task_completed']} / {m['task_total']}", "size": "sm", "color": "#153448", "align": "end" }
+                ]
+            },
+            {
+                "type": "box", "layout": "horizontal", "contents": [
+                    { "type": "text", "text": "分享專案資源數", "size": "sm", "color": "#153448", "flex": 0 },
+                    { "type": "text", "text": f"{m['resource_count']} 項", "size": "sm", "color": "#153448", "align": "end" }
+                ]
+            },
             {
-                "type": "box",
-                "layout": "horizontal",
-                "margin": "md",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": "感謝大家對此專案的努力與貢獻！",
-                        "size": "md",
-                        "color": "#153448",
-                        "flex": 0
-                    }
+                "type": "box", "layout": "horizontal", "contents": [
+                    { "type": "text", "text": "建議與反思留言數", "size": "sm", "color": "#153448", "flex": 0 },
+                    { "type": "text", "text": f"{m['comment_count']} 次", "size": "sm", "color": "#153448", "align": "end" }
+                ]
+            },
+            {
+                "type": "box", "layout": "horizontal", "contents": [
+                    { "type": "text", "text": "任務平均評分", "size": "sm", "color": "#153448" },
+                    { "type": "text", "text": rating, "size": "sm", "color": "#153448", "align": "end" }
                 ]
             }
         ]
+        # 第一位成員不加 separator
+        if i > 0:
+            template["body"]["contents"].append({ "type": "separator", "margin": "lg" })
+        template["body"]["contents"].append({ "type": "box", "layout": "vertical", "margin": "lg", "spacing": "sm", "contents": block })
 
-        return template
+    # 最後感謝區塊
+    template["body"]["contents"] += [
+        { "type": "separator", "margin": "lg" },
+        {
+            "type": "box",
+            "layout": "horizontal",
+            "margin": "md",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": "感謝大家對此專案的努力與貢獻！",
+                    "size": "md",
+                    "color": "#153448",
+                    "flex": 0
+                }
+            ]
+        }
+    ]
 
-    except Exception as e:
-        return f"❌ 生成報表失敗: {str(e)}"
+    return template
 
 
 
@@ -0,0 +1,199 @@
+"""#搜尋 指令用的分享資源索引
+
+每個專案一份記憶體內的倒排索引（title / tag / description），第一次搜尋時才從
+shared_resources 建立，之後每次 #分享 直接增量更新；專案與群組數量超過上限時以 LRU 淘汰。
+中文（CJK）以單字 + 雙字 n-gram 切詞，英數字以單字前綴切詞。
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+# CJK 統一漢字、日文假名、韓文音節；其餘英數字以單字處理
+TOKEN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+|[a-z0-9]+")
+
+# 欄位權重：標題 > 標籤 > 描述
+FIELD_WEIGHTS = {"title": 3, "tag": 2, "description": 1}
+
+# LINE 文字訊息最多 5000 字（以 UTF-16 計算）；描述與關鍵字過長時截斷
+MAX_TEXT_LENGTH = 5000
+MAX_DESCRIPTION_LENGTH = 200
+MAX_KEYWORD_LENGTH = 50
+
+
+def normalize(text):
+    """全形轉半形、轉小寫"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def is_cjk(token):
+    return not token[0].isascii()
+
+
+def index_tokens(text):
+    """建立索引用的 token：CJK 取單字與雙字 n-gram，英數字取所有前綴"""
+    tokens = set()
+    for run in TOKEN_RE.findall(normalize(text)):
+        if is_cjk(run):
+            tokens.update(run)
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.update(run[:i] for i in range(1, len(run) + 1))
+    return tokens
+
+
+def query_tokens(text):
+    """查詢用的 token：CJK 取雙字 n-gram（單一字則取單字），英數字取整個單字"""
+    tokens = set()
+    for run in TOKEN_RE.findall(normalize(text)):
+        if is_cjk(run) and len(run) > 1:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.add(run)
+    return tokens
+
+
+class ResourceIndex:
+    """單一專案的倒排索引"""
+
+    def __init__(self, rows=()):
+        self.docs = {}
+        self.postings = defaultdict(set)
+        self.built_at = time.monotonic()
+        for row in rows:
+            self.add(row)
+
+    def add(self, row):
+        doc_id = row["id"]
+        if doc_id in self.docs:
+            return
+        self.docs[doc_id] = {
+            **row,
+            "_fields": {field: normalize(row.get(field)) for field in FIELD_WEIGHTS},
+        }
+        for field in FIELD_WEIGHTS:
+            for token in index_tokens(row.get(field)):
+                self.postings[token].add(doc_id)
+
+    def search(self, query):
+        """回傳符合所有關鍵字的資源，依欄位權重與分享時間排序"""
+        terms = [normalize(t.lstrip("#")) for t in query.split()]
+        terms = [t for t in terms if t]
+        tokens = set().union(*(query_tokens(t) for t in terms)) if terms else set()
+        if not tokens:
+            return []
+
+        # 先用 posting list 取交集縮小範圍，再以子字串確認（避免 n-gram 不相連的誤判）
+        candidates = set.intersection(*(self.postings.get(t, set()) for t in tokens))
+        results = []
+        for doc_id in candidates:
+            fields = self.docs[doc_id]["_fields"]
+            score = 0
+            for term in terms:
+                term_score = sum(w for f, w in FIELD_WEIGHTS.items() if term in fields[f])
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                results.append((score, self.docs[doc_id]))
+
+        results.sort(key=lambda r: (r[0], r[1].get("created_at") or ""), reverse=True)
+        return [{k: v for k, v in doc.items() if k != "_fields"} for _, doc in results]
+
+
+class ResourceIndexCache:
+    """以 LRU 保存多個專案的索引；超過 ttl 秒會重新建立，以納入其他管道新增的資源"""
+
+    def __init__(self, max_projects=50, max_groups=1000, ttl=600):
+        self.max_projects = max_projects
+        self.max_groups = max_groups
+        self.ttl = ttl
+        self.indexes = OrderedDict()
+        self.group_projects = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expired(self, created_at):
+        return time.monotonic() - created_at > self.ttl
+
+    def get(self, project_id):
+        """取得已建立且未過期的索引，沒有則回傳 None"""
+        with self.lock:
+            index = self.indexes.get(project_id)
+            if index is None:
+                return None
+            if self._expired(index.built_at):
+                del self.indexes[project_id]
+                return None
+            self.indexes.move_to_end(project_id)
+            return index
+
+    def build(self, project_id, rows):
+        """以 shared_resources 的資料建立索引並放入快取"""
+        index = ResourceIndex(rows)
+        with self.lock:
+            self.indexes[project_id] = index
+            self.indexes.move_to_end(project_id)
+            while len(self.indexes) > self.max_projects:
+                self.indexes.popitem(last=False)
+        return index
+
+    def add_resource(self, project_id, row):
+        """新分享的資源：若該專案索引已在快取中就增量加入，否則等下次搜尋再建立"""
+        with self.lock:
+            index = self.indexes.get(project_id)
+            if index is not None:
+                index.add(row)
+
+    def project_id_for(self, group_id):
+        """群組目前對應的專案（同樣受 ttl 限制），沒有則回傳 None"""
+        with self.lock:
+            cached = self.group_projects.get(group_id)
+            if cached is None:
+                return None
+            if self._expired(cached[1]):
+                del self.group_projects[group_id]
+                return None
+            self.group_projects.move_to_end(group_id)
+            return cached[0]
+
+    def set_project_id(self, group_id, project_id):
+        with self.lock:
+            self.group_projects[group_id] = (project_id, time.monotonic())
+            self.group_projects.move_to_end(group_id)
+            # 先移除最久沒用到且已過期的群組，仍超過上限時再以 LRU 淘汰
+            while self.group_projects and self._expired(next(iter(self.group_projects.values()))[1]):
+                self.group_projects.popitem(last=False)
+            while len(self.group_projects) > self.max_groups:
+                self.group_projects.popitem(last=False)
+
+
+def line_length(text):
+    """LINE 以 UTF-16 計算文字長度（emoji 等字元算 2）"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def truncate(text, limit):
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def format_search_results(keyword, results, limit=10):
+    """把搜尋結果整理成 LINE 文字訊息（不超過 MAX_TEXT_LENGTH）"""
+    keyword = truncate(keyword, MAX_KEYWORD_LENGTH)
+    if not results:
+        return f"🔍 找不到與「{keyword}」相關的資源"
+
+    text = f"🔍 「{keyword}」找到 {len(results)} 筆資源："
+    shown = 0
+    for i, r in enumerate(results[:limit], start=1):
+        entry = f"\n\n{i}. {r['title']} #{r['tag']}\n{r['link']}"
+        if r.get("description"):
+            entry += "\n" + truncate(r["description"], MAX_DESCRIPTION_LENGTH)
+        # 保留結尾提示的空間
+        if line_length(text + entry) > MAX_TEXT_LENGTH - 100:
+            break
+        text += entry
+        shown = i
+    if len(results) > shown:
+        text += f"\n\n…還有 {len(results) - shown} 筆，請用更精確的關鍵字搜尋"
+    return text
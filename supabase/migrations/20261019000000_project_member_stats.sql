@@ -0,0 +1,338 @@
+-- 每位專案成員的累計統計，由觸發器在資料寫入時增量維護，
+-- 專案總結報表只需讀取 project_member_report 一次，不必再掃描任務、清單、評分、資源與留言。
+-- 另以 rebuild_project_member_stats() 從原始資料表重建，修正可能的偏差（見 member_stats.py）。
+
+create table if not exists project_member_stats (
+    project_id     uuid        not null,
+    user_id        text        not null,
+    task_total     integer     not null default 0,
+    task_completed integer     not null default 0,
+    resource_count integer     not null default 0,
+    comment_count  integer     not null default 0,
+    rating_sum     numeric     not null default 0,
+    rating_count   integer     not null default 0,
+    updated_at     timestamptz not null default now(),
+    primary key (project_id, user_id)
+);
+
+alter table project_member_stats enable row level security;
+
+-- 觸發器與重建時用到的查詢
+create index if not exists tasks_project_assignee_idx on tasks (project_id, assignee_id);
+create index if not exists task_checklists_task_id_idx on task_checklists (task_id);
+create index if not exists task_feedbacks_task_id_idx on task_feedbacks (task_id);
+create index if not exists shared_resources_project_user_idx on shared_resources (project_id, user_id);
+create index if not exists resource_replies_user_id_idx on resource_replies (user_id);
+
+
+-- 從原始資料表計算成員統計（與 project_summary_report.summarize_members 的規則相同）：
+--   task_completed：有清單且清單全部完成的任務
+--   rating：非反思（is_reflection = false）且有評分的回饋
+--   comment_count：該使用者的所有 resource_replies
+create or replace function compute_project_member_stats(p_project_id uuid default null, p_user_id text default null)
+returns table (
+    project_id uuid, user_id text,
+    task_total integer, task_completed integer,
+    resource_count integer, comment_count integer,
+    rating_sum numeric, rating_count integer
+)
+language sql stable
+set search_path = public
+as $$
+    select distinct on (m.project_id, m.user_id)
+        m.project_id,
+        m.user_id,
+        coalesce(t.task_total, 0)::integer,
+        coalesce(t.task_completed, 0)::integer,
+        coalesce(r.resource_count, 0)::integer,
+        coalesce(c.comment_count, 0)::integer,
+        coalesce(t.rating_sum, 0),
+        coalesce(t.rating_count, 0)::integer
+    from project_members m
+    left join lateral (
+        select
+            count(*) as task_total,
+            count(*) filter (where ck.total > 0 and ck.done = ck.total) as task_completed,
+            sum(fb.rating_sum) as rating_sum,
+            sum(fb.rating_count) as rating_count
+        from tasks tk
+        left join lateral (
+            select count(*) as total, count(*) filter (where cl.is_done) as done
+            from task_checklists cl where cl.task_id = tk.id
+        ) ck on true
+        left join lateral (
+            select sum(f.rating) as rating_sum, count(f.rating) as rating_count
+            from task_feedbacks f where f.task_id = tk.id and f.is_reflection = false
+        ) fb on true
+        where tk.project_id = m.project_id and tk.assignee_id = m.user_id
+    ) t on true
+    left join lateral (
+        select count(*) as resource_count
+        from shared_resources sr where sr.project_id = m.project_id and sr.user_id = m.user_id
+    ) r on true
+    left join lateral (
+        select count(*) as comment_count
+        from resource_replies rr where rr.user_id = m.user_id
+    ) c on true
+    where (p_project_id is null or m.project_id = p_project_id)
+      and (p_user_id is null or m.user_id = p_user_id)
+    order by m.project_id, m.user_id
+$$;
+
+
+-- 同一成員的統計同時只由一個交易更新（鎖到交易結束）。
+-- 重新計算與 ± 1 更新都先取得此鎖，避免兩個交易各自以舊的快照計算後互相覆蓋。
+create or replace function lock_member_stats(p_project_id uuid, p_user_id text)
+returns void
+language sql
+as $$
+    select pg_advisory_xact_lock(hashtext(p_project_id::text || p_user_id));
+$$;
+
+
+-- 重新計算單一成員的統計（任務、清單、評分變動時使用，只掃描該成員的任務）
+create or replace function refresh_member_stats(p_project_id uuid, p_user_id text)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    -- 未指派的任務不屬於任何成員（compute_project_member_stats 的 null 代表「所有成員」）
+    if p_project_id is null or p_user_id is null then
+        return;
+    end if;
+
+    -- 先取得鎖；READ COMMITTED 下之後的陳述式會取得新的快照，看得到先前持有鎖的交易已提交的變更
+    perform lock_member_stats(p_project_id, p_user_id);
+
+    insert into project_member_stats as s
+        (project_id, user_id, task_total, task_completed, resource_count, comment_count, rating_sum, rating_count)
+    select c.project_id, c.user_id, c.task_total, c.task_completed, c.resource_count, c.comment_count, c.rating_sum, c.rating_count
+    from compute_project_member_stats(p_project_id, p_user_id) c
+    on conflict (project_id, user_id) do update set
+        task_total = excluded.task_total,
+        task_completed = excluded.task_completed,
+        resource_count = excluded.resource_count,
+        comment_count = excluded.comment_count,
+        rating_sum = excluded.rating_sum,
+        rating_count = excluded.rating_count,
+        updated_at = now();
+end;
+$$;
+
+
+-- 從原始資料表重建統計，回傳被修正（新增或數值不同）的列數
+create or replace function rebuild_project_member_stats(p_project_id uuid default null)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    fixed integer;
+begin
+    delete from project_member_stats s
+    where (p_project_id is null or s.project_id = p_project_id)
+      and not exists (
+          select 1 from project_members m where m.project_id = s.project_id and m.user_id = s.user_id
+      );
+
+    with upserted as (
+        insert into project_member_stats as s
+            (project_id, user_id, task_total, task_completed, resource_count, comment_count, rating_sum, rating_count)
+        select c.project_id, c.user_id, c.task_total, c.task_completed, c.resource_count, c.comment_count, c.rating_sum, c.rating_count
+        from compute_project_member_stats(p_project_id) c
+        on conflict (project_id, user_id) do update set
+            task_total = excluded.task_total,
+            task_completed = excluded.task_completed,
+            resource_count = excluded.resource_count,
+            comment_count = excluded.comment_count,
+            rating_sum = excluded.rating_sum,
+            rating_count = excluded.rating_count,
+            updated_at = now()
+        where (s.task_total, s.task_completed, s.resource_count, s.comment_count, s.rating_sum, s.rating_count)
+            is distinct from
+            (excluded.task_total, excluded.task_completed, excluded.resource_count, excluded.comment_count, excluded.rating_sum, excluded.rating_count)
+        returning 1
+    )
+    select count(*) into fixed from upserted;
+
+    return fixed;
+end;
+$$;
+
+
+-- ===== 觸發器 =====
+
+-- 成員加入：建立統計列（加入前已指派的任務、分享與留言也一併計入）；成員移除：刪除統計列
+create or replace function project_member_stats_on_member()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op = 'DELETE' then
+        delete from project_member_stats where project_id = old.project_id and user_id = old.user_id;
+        return old;
+    end if;
+    perform refresh_member_stats(new.project_id, new.user_id);
+    return new;
+end;
+$$;
+
+drop trigger if exists project_member_stats_member on project_members;
+create trigger project_member_stats_member
+    after insert or delete on project_members
+    for each row execute function project_member_stats_on_member();
+
+
+-- 分享資源：resource_count ± 1
+create or replace function project_member_stats_on_resource()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform lock_member_stats(new.project_id, new.user_id);
+        update project_member_stats set resource_count = resource_count + 1, updated_at = now()
+        where project_id = new.project_id and user_id = new.user_id;
+    end if;
+    if tg_op in ('DELETE', 'UPDATE') then
+        perform lock_member_stats(old.project_id, old.user_id);
+        update project_member_stats set resource_count = resource_count - 1, updated_at = now()
+        where project_id = old.project_id and user_id = old.user_id;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists project_member_stats_resource on shared_resources;
+create trigger project_member_stats_resource
+    after insert or delete or update of project_id, user_id on shared_resources
+    for each row execute function project_member_stats_on_resource();
+
+
+-- 留言：comment_count ± 1（與報表相同，計算該使用者在所有專案的留言）
+create or replace function project_member_stats_on_reply()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform lock_member_stats(s.project_id, s.user_id)
+        from project_member_stats s where s.user_id = new.user_id order by s.project_id;
+        update project_member_stats set comment_count = comment_count + 1, updated_at = now()
+        where user_id = new.user_id;
+    end if;
+    if tg_op in ('DELETE', 'UPDATE') then
+        perform lock_member_stats(s.project_id, s.user_id)
+        from project_member_stats s where s.user_id = old.user_id order by s.project_id;
+        update project_member_stats set comment_count = comment_count - 1, updated_at = now()
+        where user_id = old.user_id;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists project_member_stats_reply on resource_replies;
+create trigger project_member_stats_reply
+    after insert or delete or update of user_id on resource_replies
+    for each row execute function project_member_stats_on_reply();
+
+
+-- 任務新增、刪除或改派：重新計算前後負責人的任務統計
+create or replace function project_member_stats_on_task()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') and old.assignee_id is not null then
+        perform refresh_member_stats(old.project_id, old.assignee_id);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') and new.assignee_id is not null then
+        perform refresh_member_stats(new.project_id, new.assignee_id);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists project_member_stats_task on tasks;
+create trigger project_member_stats_task
+    after insert or delete or update of project_id, assignee_id on tasks
+    for each row execute function project_member_stats_on_task();
+
+
+-- 清單勾選、評分變動：重新計算該任務負責人的任務統計
+create or replace function project_member_stats_on_task_detail()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    tk record;
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        for tk in select project_id, assignee_id from tasks where id = old.task_id and assignee_id is not null loop
+            perform refresh_member_stats(tk.project_id, tk.assignee_id);
+        end loop;
+    end if;
+    if tg_op = 'INSERT' or (tg_op = 'UPDATE' and new.task_id is distinct from old.task_id) then
+        for tk in select project_id, assignee_id from tasks where id = new.task_id and assignee_id is not null loop
+            perform refresh_member_stats(tk.project_id, tk.assignee_id);
+        end loop;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists project_member_stats_checklist on task_checklists;
+create trigger project_member_stats_checklist
+    after insert or delete or update of task_id, is_done on task_checklists
+    for each row execute function project_member_stats_on_task_detail();
+
+drop trigger if exists project_member_stats_feedback on task_feedbacks;
+create trigger project_member_stats_feedback
+    after insert or delete or update of task_id, rating, is_reflection on task_feedbacks
+    for each row execute function project_member_stats_on_task_detail();
+
+
+-- 報表讀取用：成員資料 + 統計（尚未有統計列的成員以 0 計）
+create or replace view project_member_report
+with (security_invoker = true)
+as
+select
+    m.project_id,
+    m.user_id,
+    m.real_name,
+    m.attribute_tags,
+    coalesce(s.task_total, 0) as task_total,
+    coalesce(s.task_completed, 0) as task_completed,
+    coalesce(s.resource_count, 0) as resource_count,
+    coalesce(s.comment_count, 0) as comment_count,
+    coalesce(s.rating_sum, 0) as rating_sum,
+    coalesce(s.rating_count, 0) as rating_count
+from project_members m
+left join project_member_stats s on s.project_id = m.project_id and s.user_id = m.user_id;
+
+
+-- 統計只由觸發器與 service role（member_stats.py）更新：security definer 的函式不開放給前端以 RPC 呼叫
+revoke execute on function
+    lock_member_stats(uuid, text),
+    compute_project_member_stats(uuid, text),
+    refresh_member_stats(uuid, text),
+    rebuild_project_member_stats(uuid)
+from public, anon, authenticated;
+grant execute on function rebuild_project_member_stats(uuid) to service_role;
+
+
+-- 首次建立時填入現有資料
+select rebuild_project_member_stats();
@@ -0,0 +1,10 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 模組載入時就會建立 Supabase / LINE 客戶端，測試時給假的設定即可
+os.environ.setdefault("SUPABASE_URL", "http://localhost:1")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.x")
+os.environ.setdefault("CHANNEL_SECRET", "test-secret")
+os.environ.setdefault("CHANNEL_ACCESS_TOKEN", "test-token")
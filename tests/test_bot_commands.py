@@ -0,0 +1,172 @@
+"""bot_commands 的解析，以及 app.py / asgi.py 執行指令後的回覆一致"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app
+import asgi
+import bot_commands
+from bot_commands import command_for, parse_join, parse_share, parse_stage_count
+from resource_search import ResourceIndexCache
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.row = None
+
+    def insert(self, row):
+        self.row = row
+        self.client.inserted.append((self.table, row))
+        return self
+
+    def __getattr__(self, name):
+        # select / eq / order / limit 都只回傳自己
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return self.client.respond(self)
+
+
+class AsyncFakeQuery(FakeQuery):
+    async def execute(self):
+        return self.client.respond(self)
+
+
+class FakeSupabase:
+    """只記錄寫入、依資料表回傳固定資料的假 Supabase client"""
+
+    query_class = FakeQuery
+
+    def __init__(self, tables=None, failing=()):
+        self.tables = tables or {}
+        self.failing = set(failing)
+        self.inserted = []
+
+    def table(self, name):
+        return self.query_class(self, name)
+
+    def respond(self, query):
+        if query.table in self.failing:
+            raise RuntimeError("db down")
+        if query.row is not None:
+            return SimpleNamespace(data=[query.row])
+        return SimpleNamespace(data=self.tables.get(query.table, []))
+
+
+class AsyncFakeSupabase(FakeSupabase):
+    query_class = AsyncFakeQuery
+
+
+def texts(messages):
+    return [m.text for m in messages]
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("開始使用", "start"),
+    ("#搜尋 Figma", "search"),
+    ("#分享 Figma UI https://figma.com", "share"),
+    ("111219060／王曉明／加入專案", "join"),
+    ("建立專案：新專案", "create_project"),
+    ("隨便聊聊", None),
+])
+def test_command_for(message, expected):
+    assert command_for(message, "U1", {}) == expected
+
+
+def test_command_for_stage_count_takes_priority_over_join():
+    state = {"U1": {"step": "waiting_for_stage_count", "project_name": "P"}}
+    assert command_for("111／王／加入專案", "U1", state) == "stage_count"
+    assert command_for("開始使用", "U1", state) == "start"
+
+
+def test_parse_share():
+    resource = parse_share("#分享 Figma UI/UX https://www.figma.com/ 視覺 設計工具", "U1", "P1")
+    assert (resource["title"], resource["tag"], resource["link"], resource["description"]) == \
+        ("Figma", "UI/UX", "https://www.figma.com/", "視覺 設計工具")
+    assert parse_share("#分享 Figma https://www.figma.com/", "U1", "P1") is None
+
+
+def test_parse_join():
+    assert parse_join("111219060／王曉明／加入專案") == ("111219060", "王曉明")
+    assert parse_join("王曉明／加入專案") is None
+
+
+def test_parse_stage_count_keeps_state_until_digits():
+    state = {"U1": {"step": "waiting_for_stage_count", "project_name": "P"}}
+    assert parse_stage_count("四", "U1", "G1", state) is None
+    assert "U1" in state
+
+    project = parse_stage_count("4", "U1", "G1", state)
+    assert (project["name"], project["stage_count"], project["group_id"]) == ("P", 4, "G1")
+    assert state == {}
+
+
+def run_app(command, message):
+    return app.run_command(command, message, "U1", "G1")
+
+
+def run_asgi(command, message):
+    return asyncio.run(asgi.run_command(command, message, "U1", "G1"))
+
+
+@pytest.fixture(params=[(app, FakeSupabase, run_app), (asgi, AsyncFakeSupabase, run_asgi)], ids=["flask", "asgi"])
+def entrypoint(request, monkeypatch):
+    """兩個入口各跑一次同樣的測試，回傳 start(**假資料) -> (module, client, run)"""
+    module, client_class, run = request.param
+    monkeypatch.setattr(module, "user_state", {})
+    monkeypatch.setattr(module, "resource_indexes", ResourceIndexCache())
+
+    def start(**client_options):
+        client = client_class(**client_options)
+        monkeypatch.setattr(module, "supabase_client", client)
+        return module, client, run
+
+    return start
+
+
+def test_stage_count_insert_error_replies_with_text(entrypoint):
+    module, client, run = entrypoint(failing={"projects"})
+    module.user_state["U1"] = {"step": "waiting_for_stage_count", "project_name": "P"}
+
+    assert texts(run("stage_count", "4")) == [bot_commands.PROJECT_CREATE_ERROR.format("db down")]
+    assert module.user_state == {}
+
+
+def test_stage_count_creates_project(entrypoint):
+    module, client, run = entrypoint()
+    module.user_state["U1"] = {"step": "waiting_for_stage_count", "project_name": "P"}
+
+    assert texts(run("stage_count", "abc")) == [bot_commands.STAGE_COUNT_FORMAT_TEXT]
+    replies = texts(run("stage_count", "4"))
+
+    assert replies[0].startswith("✅ 專案『P』已建立，共4個階段")
+    assert len(replies) == 2
+    assert client.inserted[0][0] == "projects"
+    assert module.resource_indexes.project_id_for("G1") == client.inserted[0][1]["id"]
+
+
+def test_join_and_duplicate(entrypoint):
+    module, client, run = entrypoint(tables={"projects": [{"id": "P1"}]})
+    assert texts(run("join", "111／王曉明／加入專案"))[0].startswith("✅ 你已成功加入專案！")
+    assert client.inserted == [("project_members", bot_commands.new_member("P1", "U1", "111", "王曉明"))]
+
+    client.tables["project_members"] = [{"user_id": "U1"}]
+    assert texts(run("join", "111／王曉明／加入專案")) == [bot_commands.JOIN_DUPLICATE_TEXT]
+
+
+def test_share_then_search(entrypoint):
+    module, client, run = entrypoint(tables={"projects": [{"id": "P1"}]})
+    assert texts(run("search", "#搜尋 Figma")) == ["🔍 找不到與「Figma」相關的資源"]
+
+    assert texts(run("share", "#分享 Figma UI https://www.figma.com/ 設計工具")) == ["✅ 資源「Figma」已成功分享！"]
+    assert "1. Figma #UI" in texts(run("search", "#搜尋 設計"))[0]
+
+
+def test_no_project(entrypoint):
+    module, client, run = entrypoint()
+    for command, message in [("share", "#分享 a b https://x.y"), ("search", "#搜尋 a"), ("project_summary", "生成專案報表")]:
+        assert texts(run(command, message)) == [bot_commands.NO_PROJECT_TEXT]
+    assert texts(run("join", "1／王／加入專案")) == [bot_commands.JOIN_NO_PROJECT_TEXT]
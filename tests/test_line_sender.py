@@ -0,0 +1,186 @@
+"""以 fake_line_server 驗證 LineSender 的限流、重試與訊息合併"""
+import asyncio
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+from linebot.v3.messaging import Configuration, ReplyMessageRequest, TextMessage
+from linebot.v3.messaging.exceptions import ApiException
+
+import fake_line_server
+from line_sender import AsyncLineSender, LineSender
+
+
+@pytest.fixture
+def fake_line():
+    """在隨機 port 啟動假 LINE 伺服器，回傳 start(**options) -> Configuration"""
+    servers = []
+
+    def start(fail_rate=0, server_error_rate=0, retry_after=0, latency=0, fail_first=0):
+        fake_line_server.received.clear()
+        handler = fake_line_server.make_handler(fail_rate, server_error_rate, retry_after, latency,
+                                                quiet=True, fail_first=fail_first)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return Configuration(host=f"http://127.0.0.1:{server.server_port}", access_token="test-token")
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def texts(n):
+    return [TextMessage(text=f"訊息 {i}") for i in range(n)]
+
+
+def test_retry_after_honoured_with_same_retry_key(fake_line):
+    sender = LineSender(fake_line(retry_after=1, fail_first=2), base_delay=0.01, max_delay=5)
+
+    sender.push("G1", texts(1))
+
+    received = fake_line_server.received
+    assert [r[3] for r in received] == [429, 429, 200]
+    assert received[0][2] and len({r[2] for r in received}) == 1
+    gaps = [b[4] - a[4] for a, b in zip(received, received[1:])]
+    assert all(gap >= 0.95 for gap in gaps)
+    assert sender.metrics()["retries"] == 2
+    assert sender.metrics()["failures"] == 0
+
+
+def test_push_splits_into_batches_of_five(fake_line):
+    sender = LineSender(fake_line())
+
+    sender.push("G1", texts(12))
+
+    received = fake_line_server.received
+    assert [r[1] for r in received] == [5, 5, 2]
+    assert all(r[3] == 200 for r in received)
+    assert len({r[2] for r in received}) == 3
+
+
+def test_failure_counted_after_max_retries(fake_line):
+    sender = LineSender(fake_line(fail_rate=1.0), max_retries=2, base_delay=0.01)
+
+    with pytest.raises(ApiException) as exc_info:
+        sender.push("G1", texts(1))
+
+    assert exc_info.value.status == 429
+    assert len(fake_line_server.received) == 3
+    assert sender.metrics()["retries"] == 2
+    assert sender.metrics()["failures"] == 1
+
+
+def test_retry_after_longer_than_max_delay_fails_fast(fake_line):
+    sender = LineSender(fake_line(retry_after=3600, fail_first=1), max_delay=1)
+
+    started = time.monotonic()
+    with pytest.raises(ApiException):
+        sender.push("G1", texts(1))
+
+    assert time.monotonic() - started < 1
+    assert len(fake_line_server.received) == 1
+    assert sender.metrics()["failures"] == 1
+
+
+def test_retries_stop_at_deadline(fake_line):
+    sender = LineSender(fake_line(fail_rate=1.0, retry_after=1), max_retries=10, max_delay=5, timeout=1.5)
+
+    started = time.monotonic()
+    with pytest.raises(ApiException):
+        sender.reply_message(ReplyMessageRequest(reply_token="token", messages=texts(1)))
+
+    # 第一次重試等 1 秒，第二次會超過 1.5 秒的期限，不再等待
+    assert time.monotonic() - started < 1.5
+    assert len(fake_line_server.received) == 2
+    assert sender.metrics()["failures"] == 1
+
+
+def test_reply_not_retried_on_server_error(fake_line):
+    sender = LineSender(fake_line(server_error_rate=1.0), base_delay=0.01)
+
+    with pytest.raises(ApiException) as exc_info:
+        sender.reply_message(ReplyMessageRequest(reply_token="token", messages=texts(1)))
+
+    assert exc_info.value.status == 503
+    assert len(fake_line_server.received) == 1
+
+
+def test_reply_retried_on_rate_limit(fake_line):
+    sender = LineSender(fake_line(fail_first=1), base_delay=0.01)
+
+    sender.reply_message(ReplyMessageRequest(reply_token="token", messages=texts(1)))
+
+    assert [r[3] for r in fake_line_server.received] == [429, 200]
+
+
+def test_send_coalesces_messages_to_same_target(fake_line):
+    sender = LineSender(fake_line(latency=0.3))
+
+    first = threading.Thread(target=sender.send, args=("G1", TextMessage(text="第一則")))
+    first.start()
+    time.sleep(0.1)  # 第一則送出中，後面兩則會排隊並合併成一次 push
+    others = [threading.Thread(target=sender.send, args=("G1", TextMessage(text=t))) for t in ("第二則", "第三則")]
+    for t in others:
+        t.start()
+    for t in [first, *others]:
+        t.join(timeout=5)
+
+    assert [r[1] for r in fake_line_server.received] == [1, 2]
+    assert sender.metrics()["coalesced_messages"] == 2
+    assert sender.metrics()["queue_depth"] == 0
+
+
+def test_send_raises_delivery_error(fake_line):
+    sender = LineSender(fake_line(server_error_rate=1.0), max_retries=0)
+
+    with pytest.raises(ApiException):
+        sender.send("G1", TextMessage(text="hi"))
+
+
+def test_cancelled_send_releases_target(fake_line):
+    configuration = fake_line(latency=0.5)
+
+    async def scenario():
+        sender = AsyncLineSender(configuration)
+        first = asyncio.create_task(sender.send("G1", TextMessage(text="第一則")))
+        await asyncio.sleep(0.1)
+        waiting = asyncio.create_task(sender.send("G1", TextMessage(text="第二則")))
+        await asyncio.sleep(0.05)
+
+        # 送出中的請求被取消（例如 ASGI 連線中斷），排在後面的訊息不能永遠等待
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(waiting, 5)
+        assert sender.flushing == set()
+
+        await asyncio.wait_for(sender.send("G1", TextMessage(text="第三則")), 5)
+        assert sender.metrics()["queue_depth"] == 0
+        await sender.close()
+
+    asyncio.run(scenario())
+    assert fake_line_server.received[-1][:2] == ("push", 1)
+
+
+def test_cancelled_waiter_message_is_dropped(fake_line):
+    configuration = fake_line(latency=0.3)
+
+    async def scenario():
+        sender = AsyncLineSender(configuration)
+        first = asyncio.create_task(sender.send("G1", TextMessage(text="第一則")))
+        await asyncio.sleep(0.1)
+        waiting = asyncio.create_task(sender.send("G1", TextMessage(text="第二則")))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+
+        await asyncio.wait_for(first, 5)
+        assert sender.flushing == set()
+        assert sender.metrics()["queue_depth"] == 0
+        await sender.close()
+
+    asyncio.run(scenario())
+    assert [r[1] for r in fake_line_server.received] == [1]
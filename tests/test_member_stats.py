@@ -0,0 +1,293 @@
+"""成員統計：/reconcile_member_stats 的授權，以及 migration 的觸發器與 RPC 權限
+
+SQL 的測試會用 pgserver 啟動一個暫時的 PostgreSQL（pip install pgserver psycopg2-binary），
+沒有安裝時略過。
+"""
+import random
+import threading
+import uuid
+from pathlib import Path
+
+import pytest
+
+import app
+from project_summary_report import summarize_members
+
+MIGRATION = Path(__file__).resolve().parent.parent / "supabase" / "migrations" / "20261019000000_project_member_stats.sql"
+
+STAT_KEYS = ["task_total", "task_completed", "resource_count", "comment_count", "rating_sum", "rating_count"]
+
+# 只建立 migration 與報表會用到的欄位
+SCHEMA = """
+drop schema if exists public cascade;
+create schema public;
+grant usage on schema public to anon, authenticated, service_role;
+create table projects (id uuid primary key, name text, group_id text, created_at timestamptz default now());
+create table project_members (id serial primary key, project_id uuid, user_id text, student_id text,
+                              real_name text, attribute_tags text[]);
+create table tasks (id uuid primary key, project_id uuid, assignee_id text);
+create table task_checklists (id serial primary key, task_id uuid references tasks (id) on delete cascade,
+                              is_done boolean, completed_at timestamptz);
+create table task_feedbacks (id serial primary key, task_id uuid references tasks (id) on delete cascade,
+                             rating integer, is_reflection boolean);
+create table shared_resources (id uuid primary key, user_id text, project_id uuid, title text, tag text,
+                               link text, description text, created_at timestamptz);
+create table resource_replies (id serial primary key, user_id text, resource_id uuid);
+"""
+
+# Supabase 內建的角色
+ROLES = """
+do $$
+declare
+    r text;
+begin
+    foreach r in array array['anon', 'authenticated', 'service_role'] loop
+        if not exists (select 1 from pg_roles where rolname = r) then
+            execute format('create role %I nologin', r);
+        end if;
+    end loop;
+end
+$$;
+"""
+
+# 隨機寫入的操作（涵蓋所有觸發器）
+OPERATIONS = {
+    "member": "insert into project_members (project_id, user_id, real_name) "
+              "select %(p)s, %(u)s, %(u)s where not exists "
+              "(select 1 from project_members where project_id = %(p)s and user_id = %(u)s)",
+    "unmember": "delete from project_members where id in (select id from project_members order by random() limit 1)",
+    "task": "insert into tasks values (gen_random_uuid(), %(p)s, %(u)s)",
+    "reassign": "update tasks set assignee_id = %(u)s where id in (select id from tasks order by random() limit 1)",
+    "delete_task": "delete from tasks where id in (select id from tasks order by random() limit 1)",
+    "checklist": "insert into task_checklists (task_id, is_done) select id, %(flag)s from tasks order by random() limit 1",
+    "toggle": "update task_checklists set is_done = not is_done "
+              "where id in (select id from task_checklists order by random() limit 1)",
+    "delete_checklist": "delete from task_checklists where id in (select id from task_checklists order by random() limit 1)",
+    "feedback": "insert into task_feedbacks (task_id, rating, is_reflection) "
+                "select id, %(rating)s, %(flag)s from tasks order by random() limit 1",
+    "update_feedback": "update task_feedbacks set rating = %(rating)s, is_reflection = %(flag)s "
+                       "where id in (select id from task_feedbacks order by random() limit 1)",
+    "delete_feedback": "delete from task_feedbacks where id in (select id from task_feedbacks order by random() limit 1)",
+    "resource": "insert into shared_resources (id, user_id, project_id, title) values (gen_random_uuid(), %(u)s, %(p)s, 't')",
+    "delete_resource": "delete from shared_resources where id in (select id from shared_resources order by random() limit 1)",
+    "reply": "insert into resource_replies (user_id) values (%(u)s)",
+    "delete_reply": "delete from resource_replies where id in (select id from resource_replies order by random() limit 1)",
+}
+
+
+# ===== /reconcile_member_stats =====
+
+@pytest.fixture
+def client(monkeypatch):
+    import member_stats
+    monkeypatch.setattr(member_stats, "reconcile_member_stats", lambda project_id=None: 3)
+    return app.app.test_client()
+
+
+def test_reconcile_rejects_when_secret_not_configured(client, monkeypatch):
+    monkeypatch.delenv("CRON_SECRET", raising=False)
+    assert client.get("/reconcile_member_stats").status_code == 503
+
+
+def test_reconcile_requires_matching_secret(client, monkeypatch):
+    monkeypatch.setenv("CRON_SECRET", "s3cret")
+    assert client.get("/reconcile_member_stats").status_code == 401
+    assert client.get("/reconcile_member_stats", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    res = client.get("/reconcile_member_stats", headers={"Authorization": "Bearer s3cret"})
+    assert res.status_code == 200
+    assert res.get_json() == {"success": True, "fixed": 3}
+
+
+# ===== migration（暫時的 PostgreSQL） =====
+
+@pytest.fixture(scope="module")
+def pg_uri(tmp_path_factory):
+    pgserver = pytest.importorskip("pgserver")
+    pytest.importorskip("psycopg2")
+    server = pgserver.get_server(tmp_path_factory.mktemp("pgdata"), cleanup_mode="stop")
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture
+def db(pg_uri):
+    """套用 migration 後的資料庫，回傳 autocommit 的 cursor"""
+    import psycopg2
+    import psycopg2.extras
+
+    conn = psycopg2.connect(pg_uri)
+    conn.autocommit = True
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute(ROLES)
+    cur.execute(SCHEMA)
+    cur.execute(MIGRATION.read_text(encoding="utf-8"))
+    yield cur
+    conn.close()
+
+
+def fetch(cur, query, *args):
+    cur.execute(query, args)
+    return cur.fetchall()
+
+
+def random_writes(cur, projects, users, steps, seed=0):
+    rng = random.Random(seed)
+    for _ in range(steps):
+        cur.execute(OPERATIONS[rng.choice(list(OPERATIONS))], {
+            "p": rng.choice(projects),
+            "u": rng.choice(users),
+            "flag": rng.random() < 0.4,
+            "rating": rng.choice([None, 1, 3, 5]),
+        })
+
+
+def python_summary(cur, project_id):
+    """以 project_summary_report 從原始資料表計算的結果"""
+    members = fetch(cur, "select user_id, real_name, attribute_tags from project_members where project_id = %s", project_id)
+    tasks = fetch(cur, "select id, assignee_id from tasks where project_id = %s", project_id)
+    member_ids = {m["user_id"] for m in members}
+    task_ids = [t["id"] for t in tasks if t["assignee_id"] in member_ids]
+    checklists = fetch(cur, "select task_id, is_done from task_checklists where task_id = any(%s::uuid[])", task_ids)
+    feedbacks = fetch(cur, "select task_id, rating from task_feedbacks "
+                           "where task_id = any(%s::uuid[]) and is_reflection = false", task_ids)
+    resources = fetch(cur, "select user_id from shared_resources where project_id = %s", project_id)
+    replies = fetch(cur, "select user_id from resource_replies")
+    summary = summarize_members(members, tasks, checklists, feedbacks, resources, replies)
+    return {user_id: {k: float(s[k]) for k in STAT_KEYS} for user_id, s in summary.items()}
+
+
+def report(cur, project_id):
+    rows = fetch(cur, "select * from project_member_report where project_id = %s", project_id)
+    return {r["user_id"]: {k: float(r[k]) for k in STAT_KEYS} for r in rows}
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_triggers_keep_report_in_sync(db, seed):
+    projects = [str(uuid.uuid4()) for _ in range(3)]
+    users = [f"U{i}" for i in range(6)]
+    random_writes(db, projects, users, steps=500, seed=seed)
+
+    for project_id in projects:
+        assert report(db, project_id) == python_summary(db, project_id)
+
+    db.execute("select rebuild_project_member_stats() as fixed")
+    assert db.fetchone()["fixed"] == 0
+
+
+def test_rebuild_fixes_drift(db):
+    projects = [str(uuid.uuid4())]
+    random_writes(db, projects, ["U1", "U2", "U3"], steps=200)
+    db.execute("insert into project_members (project_id, user_id) values (%s, 'U9')", projects)
+    expected = report(db, projects[0])
+
+    db.execute("update project_member_stats set task_total = task_total + 7")
+    db.execute("delete from project_member_stats where user_id = 'U9'")
+    db.execute("select rebuild_project_member_stats(%s) as fixed", projects)
+
+    assert db.fetchone()["fixed"] == len(expected)
+    assert report(db, projects[0]) == expected
+
+
+@pytest.mark.parametrize("role", ["anon", "authenticated"])
+@pytest.mark.parametrize("call", [
+    "select rebuild_project_member_stats()",
+    "select refresh_member_stats(gen_random_uuid(), 'U1')",
+    "select * from compute_project_member_stats()",
+])
+def test_stats_functions_not_callable_by_clients(db, role, call):
+    import psycopg2
+
+    db.execute(f"set role {role}")
+    try:
+        with pytest.raises(psycopg2.errors.InsufficientPrivilege, match="permission denied for function"):
+            db.execute(call)
+    finally:
+        db.execute("reset role")
+
+
+def test_service_role_can_rebuild(db):
+    db.execute("set role service_role")
+    try:
+        db.execute("select rebuild_project_member_stats() as fixed")
+        assert db.fetchone()["fixed"] == 0
+    finally:
+        db.execute("reset role")
+
+
+def member_row(cur, project_id, user_id):
+    rows = fetch(cur, "select * from project_member_stats where project_id = %s and user_id = %s", project_id, user_id)
+    return rows[0]
+
+
+def computed_row(cur, project_id, user_id):
+    return fetch(cur, "select * from compute_project_member_stats(%s, %s)", project_id, user_id)[0]
+
+
+@pytest.fixture
+def concurrent(db, pg_uri):
+    """一位成員、兩個各有一項未完成清單的任務；回傳 (project_id, task_ids, run)
+
+    run(first_sql, second_sql)：第一個交易執行後先不提交，第二個交易在另一條連線同時執行，
+    之後才提交第一個交易，等第二個交易完成。
+    """
+    import psycopg2
+
+    project_id = str(uuid.uuid4())
+    task_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+    db.execute("insert into project_members (project_id, user_id) values (%s, 'U1')", (project_id,))
+    for task_id in task_ids:
+        db.execute("insert into tasks values (%s, %s, 'U1')", (task_id, project_id))
+        db.execute("insert into task_checklists (task_id, is_done) values (%s, false)", (task_id,))
+
+    def run(first_sql, second_sql):
+        first = psycopg2.connect(pg_uri)
+        second = psycopg2.connect(pg_uri)
+        try:
+            first.cursor().execute(first_sql)
+            thread = threading.Thread(target=lambda: (second.cursor().execute(second_sql), second.commit()))
+            thread.start()
+            thread.join(timeout=0.5)
+            # 同一成員的統計被第一個交易鎖住，第二個交易要等它提交
+            assert thread.is_alive()
+            first.commit()
+            thread.join(timeout=5)
+            assert not thread.is_alive()
+        finally:
+            first.close()
+            second.close()
+
+    return project_id, task_ids, run
+
+
+def test_concurrent_checklist_updates_are_not_lost(db, concurrent):
+    project_id, task_ids, run = concurrent
+    run(f"update task_checklists set is_done = true where task_id = '{task_ids[0]}'",
+        f"update task_checklists set is_done = true where task_id = '{task_ids[1]}'")
+
+    assert member_row(db, project_id, "U1")["task_completed"] == 2
+    assert computed_row(db, project_id, "U1")["task_completed"] == 2
+
+
+def test_concurrent_reply_and_refresh_are_not_lost(db, concurrent):
+    project_id, task_ids, run = concurrent
+    run("insert into resource_replies (user_id) values ('U1')",
+        f"update task_checklists set is_done = true where task_id = '{task_ids[0]}'")
+
+    row = member_row(db, project_id, "U1")
+    assert (row["comment_count"], row["task_completed"]) == (1, 1)
+
+
+def test_unassigned_task_does_not_refresh_members(db):
+    project_id = str(uuid.uuid4())
+    task_id = str(uuid.uuid4())
+    for user_id in ["U1", "U2"]:
+        db.execute("insert into project_members (project_id, user_id) values (%s, %s)", (project_id, user_id))
+    db.execute("insert into tasks values (%s, %s, null)", (task_id, project_id))
+    before = fetch(db, "select user_id, updated_at from project_member_stats order by user_id")
+
+    db.execute("insert into task_checklists (task_id, is_done) values (%s, true)", (task_id,))
+    db.execute("insert into task_feedbacks (task_id, rating, is_reflection) values (%s, 5, false)", (task_id,))
+    db.execute("update tasks set project_id = project_id where id = %s", (task_id,))
+
+    assert fetch(db, "select user_id, updated_at from project_member_stats order by user_id") == before
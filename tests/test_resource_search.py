@@ -0,0 +1,123 @@
+"""#搜尋 的索引、查詢與快取"""
+import time
+
+from resource_search import (
+    ResourceIndex, ResourceIndexCache, format_search_results, line_length, MAX_TEXT_LENGTH
+)
+
+ROWS = [
+    {"id": "1", "title": "Figma", "tag": "UI", "link": "https://www.figma.com/",
+     "description": "視覺設計工具", "created_at": "2026-10-01"},
+    {"id": "2", "title": "Miro", "tag": "協作", "link": "https://miro.com/",
+     "description": "線上白板，適合設計發想", "created_at": "2026-10-02"},
+    {"id": "3", "title": "Notion", "tag": "筆記", "link": "https://www.notion.so/",
+     "description": "專案管理與文件", "created_at": "2026-10-03"},
+]
+
+
+def titles(results):
+    return [r["title"] for r in results]
+
+
+def test_cjk_bigram_query():
+    index = ResourceIndex(ROWS)
+    assert titles(index.search("設計")) == ["Miro", "Figma"]
+    assert titles(index.search("專案管理")) == ["Notion"]
+    # 兩個字都出現但不相連，不算符合
+    assert index.search("設具") == []
+
+
+def test_ascii_prefix_query_is_case_insensitive():
+    index = ResourceIndex(ROWS)
+    assert titles(index.search("fig")) == ["Figma"]
+    assert titles(index.search("ＦＩＧ")) == ["Figma"]
+    assert index.search("igma") == []
+
+
+def test_multiple_terms_must_all_match():
+    index = ResourceIndex(ROWS)
+    assert titles(index.search("設計 白板")) == ["Miro"]
+    assert index.search("設計 筆記") == []
+
+
+def test_tag_query_strips_hash_on_every_term():
+    index = ResourceIndex(ROWS)
+    assert titles(index.search("#UI")) == ["Figma"]
+    assert titles(index.search("設計 #UI")) == ["Figma"]
+    assert titles(index.search("#協作 #設計")) == ["Miro"]
+    assert index.search("#") == []
+
+
+def test_title_match_ranks_above_description():
+    index = ResourceIndex(ROWS + [{"id": "4", "title": "白板", "tag": "工具", "link": "https://x.y/",
+                                   "description": "", "created_at": "2026-09-01"}])
+    assert titles(index.search("白板")) == ["白板", "Miro"]
+
+
+def test_cache_evicts_least_recently_used_project():
+    cache = ResourceIndexCache(max_projects=2)
+    cache.build("P1", ROWS)
+    cache.build("P2", ROWS)
+    assert cache.get("P1") is not None  # P1 變成最近使用
+    cache.build("P3", ROWS)
+
+    assert cache.get("P2") is None
+    assert cache.get("P1") is not None
+    assert cache.get("P3") is not None
+
+
+def test_cache_evicts_least_recently_used_group():
+    cache = ResourceIndexCache(max_groups=2)
+    cache.set_project_id("G1", "P1")
+    cache.set_project_id("G2", "P2")
+    assert cache.project_id_for("G1") == "P1"
+    cache.set_project_id("G3", "P3")
+
+    assert cache.project_id_for("G2") is None
+    assert cache.project_id_for("G1") == "P1"
+    assert len(cache.group_projects) == 2
+
+
+def test_cache_entries_expire_after_ttl():
+    cache = ResourceIndexCache(ttl=0.05)
+    cache.build("P1", ROWS)
+    cache.set_project_id("G1", "P1")
+    time.sleep(0.1)
+
+    assert cache.get("P1") is None
+    assert cache.project_id_for("G1") is None
+    assert not cache.indexes and not cache.group_projects
+
+
+def test_expired_groups_removed_on_set():
+    cache = ResourceIndexCache(ttl=0.05)
+    cache.set_project_id("G1", "P1")
+    time.sleep(0.1)
+    cache.set_project_id("G2", "P2")
+    assert list(cache.group_projects) == ["G2"]
+
+
+def test_add_resource_updates_cached_index():
+    cache = ResourceIndexCache()
+    cache.add_resource("P1", ROWS[0])  # 尚未建立索引時忽略
+    index = cache.build("P1", ROWS[1:])
+    cache.add_resource("P1", ROWS[0])
+    assert titles(index.search("figma")) == ["Figma"]
+
+
+def test_format_results_stays_within_line_limit():
+    rows = [{"id": str(i), "title": f"資源{i}", "tag": "😀", "link": "https://example.com/" + "a" * 400,
+             "description": "很長的描述" * 500} for i in range(10)]
+    text = format_search_results("描述", rows)
+
+    assert line_length(text) <= MAX_TEXT_LENGTH
+    assert "很長的描述" * 100 not in text
+    assert "請用更精確的關鍵字搜尋" in text
+
+
+def test_format_results_lists_remaining_count():
+    rows = [dict(ROWS[0], id=str(i)) for i in range(12)]
+    text = format_search_results("figma", rows)
+    assert "10. Figma #UI" in text
+    assert "…還有 2 筆" in text
+    assert format_search_results("x", []) == "🔍 找不到與「x」相關的資源"